@@ -0,0 +1,215 @@
+"""
+Бенчмарк конвейера генерации аудио: парсинг и сборка трека тем же
+build_track/create_audio, что и в боте, включая склейку MP3-кадров и
+кэши. Время стадий берётся из таймеров metrics (bot_stage_seconds).
+
+Каждый случай прогоняется трижды: с пустыми кэшами, с клипами в кэше
+(новый список из знакомых слов) и с готовым треком в кэше треков.
+
+Работает без сети: синтез выполняет заглушка TTS (TTS_BACKEND=stub).
+Каждый случай запускается в отдельном процессе, чтобы пиковая память
+не накапливалась между случаями.
+
+Примеры:
+    python bench.py
+    python bench.py --sizes 1 50 500 --repeats 3 --pauses 500 --output new.json
+    python bench.py --compare old.json --output new.json
+    python bench.py --profile voice
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+
+DEFAULT_SIZES = [1, 10, 50, 200, 500]
+DEFAULT_REPEATS = [1, 3, 7]
+DEFAULT_PAUSES = [300, 1000]
+CASE_TIMEOUT_SEC = 600
+
+def make_word_list(size):
+    """Текст сообщения из size пар слов (с повторами, как у реальных списков)"""
+    lines = []
+    for i in range(size):
+        word = i % max(1, size * 4 // 5)
+        lines.append(f"word{word} - слово{word}")
+    return '\n'.join(lines)
+
+def stage_seconds(bot):
+    """Суммарное время стадий из гистограммы bot_stage_seconds"""
+    return {
+        dict(labels)['stage']: total
+        for name, labels, _, total, _ in bot.metrics.snapshot()['histograms']
+        if name == 'bot_stage_seconds'
+    }
+
+def run_case(size, repeat_count, pause_ms, profile, result_queue):
+    """Один прогон конвейера в чистом процессе"""
+    cache_dir = tempfile.mkdtemp(prefix='bench-')
+    os.environ['TTS_BACKEND'] = 'stub'
+    os.environ['CLIP_CACHE_DIR'] = os.path.join(cache_dir, 'clips')
+    os.environ['TRACK_CACHE_DIR'] = os.path.join(cache_dir, 'tracks')
+    os.environ['BOT_DB_PATH'] = os.path.join(cache_dir, 'bot.sqlite3')
+
+    # Подсчёт запусков ffmpeg: subprocess.run и pydub создают Popen
+    ffmpeg_runs = [0]
+    original_popen = subprocess.Popen
+
+    class CountingPopen(original_popen):
+        def __init__(self, args, *rest, **kwargs):
+            program = args[0] if isinstance(args, (list, tuple)) else str(args)
+            if 'ffmpeg' in os.path.basename(str(program)) or 'ffprobe' in str(program):
+                ffmpeg_runs[0] += 1
+            super().__init__(args, *rest, **kwargs)
+
+    subprocess.Popen = CountingPopen
+
+    import bot
+
+    direction = 'en-ru'
+    settings = dict(
+        bot.DEFAULT_SETTINGS,
+        repeat_count=repeat_count,
+        pause_ms=pause_ms,
+        direction=direction,
+        output=profile
+    )
+    text = make_word_list(size)
+    stages = {}
+
+    start = time.perf_counter()
+    pairs = bot.parse_word_pairs(text)
+    stages['parse'] = time.perf_counter() - start
+
+    # Пустые кэши: синтез и подготовка клипов, сборка, кодирование
+    start = time.perf_counter()
+    output, duration = bot.build_track(pairs, settings, direction)
+    cold = time.perf_counter() - start
+    stages.update(stage_seconds(bot))
+    cold_ffmpeg_runs = ffmpeg_runs[0]
+
+    # Клипы в кэше: новый список из уже знакомых слов
+    start = time.perf_counter()
+    bot.create_audio(pairs, settings, direction)
+    clips_cached = time.perf_counter() - start
+
+    # Тот же список ещё раз: трек из кэша треков
+    start = time.perf_counter()
+    bot.build_track(pairs, settings, direction)
+    track_cached = time.perf_counter() - start
+
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    result_queue.put({
+        'lines': size,
+        'pairs': len(pairs),
+        'repeat_count': repeat_count,
+        'pause_ms': pause_ms,
+        'unique_clips': len(bot.build_synthesis_plan(pairs, direction)),
+        'stages': stages,
+        'total': stages['parse'] + cold,
+        'clips_cached': clips_cached,
+        'track_cached': track_cached,
+        'audio_seconds': duration,
+        'output_bytes': len(output.getvalue()),
+        'ffmpeg_runs': cold_ffmpeg_runs,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    })
+
+def git_revision():
+    """Текущий коммит, если бенчмарк запущен из git-репозитория"""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def case_key(case):
+    # В старых отчётах 'pairs' — число строк списка
+    return (case.get('lines', case['pairs']), case['repeat_count'], case['pause_ms'])
+
+def print_case(case, previous=None):
+    stages = ' '.join(
+        f"{name}={seconds * 1000:.1f}ms" for name, seconds in case['stages'].items()
+    )
+    line = (
+        f"lines={case['lines']:<4} pairs={case['pairs']:<4} "
+        f"repeat={case['repeat_count']} pause={case['pause_ms']:<5} "
+        f"total={case['total'] * 1000:8.1f}ms "
+        f"clips_cached={case['clips_cached'] * 1000:.1f}ms "
+        f"track_cached={case['track_cached'] * 1000:.1f}ms "
+        f"rss={case['peak_rss_kb'] // 1024}MB "
+        f"ffmpeg={case['ffmpeg_runs']} out={case['output_bytes']} | {stages}"
+    )
+    if previous is not None and previous['total']:
+        change = (case['total'] - previous['total']) / previous['total'] * 100
+        line += f" | {change:+.1f}% vs baseline"
+    print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк конвейера генерации аудио')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--repeats', type=int, nargs='+', default=DEFAULT_REPEATS)
+    parser.add_argument('--pauses', type=int, nargs='+', default=DEFAULT_PAUSES)
+    parser.add_argument('--profile', default='mp3', choices=['mp3', 'speech', 'voice'],
+                        help='профиль итогового файла (OUTPUT_PROFILES)')
+    parser.add_argument('--output', help='сохранить результаты в JSON')
+    parser.add_argument('--compare', help='JSON предыдущего прогона для сравнения')
+    args = parser.parse_args()
+
+    if shutil.which('ffmpeg') is None:
+        print("ffmpeg не найден: он нужен для подготовки клипов и кодирования")
+        return 1
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = {case_key(case): case for case in json.load(f)['cases']}
+
+    context = multiprocessing.get_context('spawn')
+    cases = []
+    for size in args.sizes:
+        for repeat_count in args.repeats:
+            for pause_ms in args.pauses:
+                result_queue = context.Queue()
+                process = context.Process(
+                    target=run_case,
+                    args=(size, repeat_count, pause_ms, args.profile, result_queue)
+                )
+                process.start()
+                try:
+                    case = result_queue.get(timeout=CASE_TIMEOUT_SEC)
+                except queue.Empty:
+                    process.kill()
+                    print(f"lines={size} repeat={repeat_count} pause={pause_ms}: прогон не завершился")
+                    continue
+                finally:
+                    process.join()
+                cases.append(case)
+                print_case(case, baseline.get(case_key(case)))
+
+    if args.output:
+        report = {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'profile': args.profile,
+            'cases': cases,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nРезультаты сохранены в {args.output}")
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,19 +6,56 @@ Telegram бот для генерации аудио
 
 import io
 import os
+import re
+import csv
+import json
+import math
+import wave
+import array
+import sqlite3
+import secrets
+import signal
+import argparse
+import multiprocessing
+from datetime import datetime, timezone
+import time
+import base64
+import asyncio
+import tempfile
+import selectors
+import subprocess
+import urllib.request
+import hashlib
 import logging
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import Counter, OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import requests
+from requests.adapters import HTTPAdapter
+from telegram import (
+    Bot,
+    Chat,
+    Message,
+    Update,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InlineQueryResultCachedVoice
+)
+from telegram.error import BadRequest
 from telegram.ext import (
     Application,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
+    InlineQueryHandler,
     ContextTypes,
     filters
 )
-from gtts import gTTS
+from gtts import gTTS, gTTSError
 from pydub import AudioSegment
-import tempfile
+from pydub.silence import detect_leading_silence
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -29,13 +66,166 @@ logger = logging.getLogger(__name__)
 # Получаем токен из переменной окружения
 BOT_TOKEN = os.environ.get('BOT_TOKEN', '8586424822:AAHOvZlko-7_xV9Kc_mL96RsG61RDm0kfHQ')
 
-# Настройки по умолчанию для каждого пользователя
-user_settings = {}
+# Адрес Bot API: локальный сервер или loadtest.py (пусто — api.telegram.org)
+BOT_API_BASE_URL = os.environ.get('BOT_API_BASE_URL', '').rstrip('/')
+
+# Кэш синтезированных клипов (общий для всех пользователей)
+CLIP_CACHE_DIR = os.environ.get('CLIP_CACHE_DIR', 'cache/clips')
+CLIP_CACHE_MAX_MB = int(os.environ.get('CLIP_CACHE_MAX_MB', '500'))
+CLIP_CACHE_MEMORY_ITEMS = int(os.environ.get('CLIP_CACHE_MEMORY_ITEMS', '2000'))
+CLIP_CACHE_MEMORY_MB = int(os.environ.get('CLIP_CACHE_MEMORY_MB', '32'))
+
+# Кэш готовых треков (одинаковые списки слов с одинаковыми настройками)
+TRACK_CACHE_DIR = os.environ.get('TRACK_CACHE_DIR', 'cache/tracks')
+TRACK_CACHE_MAX_MB = int(os.environ.get('TRACK_CACHE_MAX_MB', '200'))
+TRACK_CACHE_MEMORY_ITEMS = int(os.environ.get('TRACK_CACHE_MEMORY_ITEMS', '20'))
+
+# Движок синтеза речи по умолчанию: gtts, espeak или stub
+TTS_BACKEND = os.environ.get('TTS_BACKEND', 'gtts')
+ESPEAK_BINARY = os.environ.get('ESPEAK_BINARY', 'espeak-ng')
+TTS_STUB_LATENCY_MS = int(os.environ.get('TTS_STUB_LATENCY_MS', '0'))
+
+# Параллельная загрузка клипов из TTS
+TTS_CONCURRENCY = int(os.environ.get('TTS_CONCURRENCY', '8'))
+TTS_RETRIES = int(os.environ.get('TTS_RETRIES', '3'))
+TTS_BACKOFF_SEC = float(os.environ.get('TTS_BACKOFF_SEC', '0.5'))
+# Потолок паузы перед повтором, в том числе из заголовка Retry-After
+TTS_MAX_RETRY_DELAY_SEC = float(os.environ.get('TTS_MAX_RETRY_DELAY_SEC', '5'))
+
+# Формат PCM для сборки трека (родной формат gTTS)
+AUDIO_FRAME_RATE = 24000
+AUDIO_CHANNELS = 1
+AUDIO_SAMPLE_WIDTH = 2
+
+# Доступные паузы между словами (мс), для них заранее готовится тишина
+PAUSE_OPTIONS = (300, 500, 800, 1000, 1500)
+
+# Склейка MP3-кадров без декодирования и перекодирования
+AUDIO_MP3_CONCAT = os.environ.get('AUDIO_MP3_CONCAT', '1') == '1'
+
+# Подготовка клипа при первом синтезе: обрезка тишины по краям и
+# выравнивание громкости. В кэш кладётся MP3 в формате gTTS, так что
+# подготовленные клипы тоже склеиваются кадрами (AUDIO_MP3_CONCAT).
+CLIP_PREPARE = os.environ.get('CLIP_PREPARE', '1') == '1'
+CLIP_SILENCE_DBFS = float(os.environ.get('CLIP_SILENCE_DBFS', '-50'))
+CLIP_EDGE_MS = int(os.environ.get('CLIP_EDGE_MS', '20'))
+CLIP_TARGET_DBFS = float(os.environ.get('CLIP_TARGET_DBFS', '-20'))
+# Сколько клипов готовится за один запуск ffmpeg
+CLIP_PREPARE_BATCH = int(os.environ.get('CLIP_PREPARE_BATCH', '32'))
+
+# Пул генерации аудио: thread или process
+AUDIO_POOL = os.environ.get('AUDIO_POOL', 'thread')
+AUDIO_WORKERS = int(os.environ.get('AUDIO_WORKERS', '2'))
+AUDIO_QUEUE_SIZE = int(os.environ.get('AUDIO_QUEUE_SIZE', '20'))
+AUDIO_JOBS_PER_USER = int(os.environ.get('AUDIO_JOBS_PER_USER', '1'))
+# Как часто обновлять у ожидающих номер в очереди (первый — сразу)
+QUEUE_POSITION_INTERVAL_SEC = float(os.environ.get('QUEUE_POSITION_INTERVAL_SEC', '5'))
+
+# Режим получения обновлений: polling или webhook
+BOT_MODE = os.environ.get('BOT_MODE', 'polling')
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL', '')
+WEBHOOK_LISTEN = os.environ.get('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.environ.get('PORT', '8443'))
+WEBHOOK_PATH = os.environ.get('WEBHOOK_PATH', 'telegram')
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET', '')
+WEBHOOK_MAX_CONNECTIONS = int(os.environ.get('WEBHOOK_MAX_CONNECTIONS', '40'))
+
+# Шардированные воркеры-процессы с общей очередью задач в SQLite
+# (0 — аудио создаётся в основном процессе)
+SHARDED_WORKERS = int(os.environ.get('SHARDED_WORKERS', '0'))
+JOB_POLL_SEC = float(os.environ.get('JOB_POLL_SEC', '0.2'))
+# Как часто основной процесс проверяет воркеры и воркеры сохраняют метрики
+WORKER_CHECK_SEC = float(os.environ.get('WORKER_CHECK_SEC', '5'))
+
+# Журнал задач для продолжения после перезапуска и время, которое
+# задачам даётся на завершение при остановке
+JOB_JOURNAL_PATH = os.environ.get('JOB_JOURNAL_PATH', 'data/jobs.jsonl')
+JOB_DRAIN_SEC = float(os.environ.get('JOB_DRAIN_SEC', '20'))
+
+# Длинные списки отправляются частями по мере готовности
+STREAM_CHUNK_PAIRS = int(os.environ.get('STREAM_CHUNK_PAIRS', '40'))
+
+# Лимит Telegram на длину подписи к файлу
+CAPTION_LIMIT = 1024
+
+# Ограничения нагрузки: на пользователя и глобально, в минуту
+MAX_PAIRS_PER_MESSAGE = int(os.environ.get('MAX_PAIRS_PER_MESSAGE', '200'))
+USER_JOBS_PER_MIN = int(os.environ.get('USER_JOBS_PER_MIN', '6'))
+USER_PAIRS_PER_MIN = int(os.environ.get('USER_PAIRS_PER_MIN', '400'))
+GLOBAL_JOBS_PER_MIN = int(os.environ.get('GLOBAL_JOBS_PER_MIN', '120'))
+GLOBAL_PAIRS_PER_MIN = int(os.environ.get('GLOBAL_PAIRS_PER_MIN', '10000'))
+
+# Файлы со словами
+MAX_DOCUMENT_MB = float(os.environ.get('MAX_DOCUMENT_MB', '1'))
+MAX_PAIRS_PER_DOCUMENT = int(os.environ.get('MAX_PAIRS_PER_DOCUMENT', '1000'))
+
+# Прогрев кэша клипов частыми словами, пока воркеры простаивают (0 — выключен)
+WARMUP_IDLE_SEC = float(os.environ.get('WARMUP_IDLE_SEC', '60'))
+WARMUP_TOP_WORDS = int(os.environ.get('WARMUP_TOP_WORDS', '1000'))
+WARMUP_BATCH = int(os.environ.get('WARMUP_BATCH', '20'))
+WARMUP_CONCURRENCY = int(os.environ.get('WARMUP_CONCURRENCY', '2'))
+
+# Произношение одного слова (/say и inline-режим). Чат, куда бот
+# загружает голосовые клипы, чтобы получить file_id для inline-ответа
+SAY_MAX_CHARS = int(os.environ.get('SAY_MAX_CHARS', '100'))
+CLIP_STORAGE_CHAT_ID = int(os.environ.get('CLIP_STORAGE_CHAT_ID', '0'))
+
+# Inline-запросы приходят на каждое нажатие клавиши: новый клип
+# синтезируется только для запроса не короче INLINE_MIN_CHARS, после
+# паузы ввода INLINE_DEBOUNCE_SEC и в пределах своих лимитов в минуту
+# (общий лимит — из-за ограничения Telegram на сообщения в один чат)
+INLINE_MIN_CHARS = int(os.environ.get('INLINE_MIN_CHARS', '2'))
+INLINE_DEBOUNCE_SEC = float(os.environ.get('INLINE_DEBOUNCE_SEC', '0.7'))
+INLINE_USER_CLIPS_PER_MIN = int(os.environ.get('INLINE_USER_CLIPS_PER_MIN', '10'))
+INLINE_GLOBAL_CLIPS_PER_MIN = int(os.environ.get('INLINE_GLOBAL_CLIPS_PER_MIN', '20'))
+
+# Метрики: HTTP-эндпоинт в формате Prometheus (0 — выключен) и сводка в лог
+METRICS_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.environ.get('METRICS_PORT', '0'))
+METRICS_LOG_SEC = float(os.environ.get('METRICS_LOG_SEC', '300'))
+
+# Хранилище настроек пользователей: sqlite или memory
+SETTINGS_BACKEND = os.environ.get('SETTINGS_BACKEND', 'sqlite')
+BOT_DB_PATH = os.environ.get('BOT_DB_PATH', 'data/bot.sqlite3')
+SETTINGS_CACHE_SIZE = int(os.environ.get('SETTINGS_CACHE_SIZE', '10000'))
+SETTINGS_FLUSH_SEC = float(os.environ.get('SETTINGS_FLUSH_SEC', '5'))
 
+# Настройки по умолчанию для каждого пользователя
 DEFAULT_SETTINGS = {
     'repeat_count': 3,
     'pause_ms': 500,
-    'direction': 'en-ru'
+    'direction': 'en-ru',
+    'output': 'mp3'
+}
+
+# Профили итогового файла: параметры кодировщика ffmpeg и способ отправки.
+# Для синтезированной речи в моно хватает низкого битрейта; быстрые
+# режимы кодировщиков заметно снижают CPU на секунду аудио.
+# stream — параметры MP3-кадров профиля: склеенные кадры клипов
+# отдаются без перекодирования, только если совпадают с ними.
+OUTPUT_PROFILES = {
+    'mp3': {
+        'name': 'MP3 128 кбит/с',
+        'format': 'mp3',
+        'send': 'audio',
+        'args': ['-c:a', 'libmp3lame', '-b:a', '128k', '-f', 'mp3'],
+        'stream': {'bitrate': 128000},
+    },
+    'speech': {
+        'name': 'MP3 для речи, 32 кбит/с',
+        'format': 'mp3',
+        'send': 'audio',
+        'args': ['-c:a', 'libmp3lame', '-ar', '24000', '-ac', '1', '-b:a', '32k',
+                 '-compression_level', '7', '-f', 'mp3'],
+        'stream': {'sample_rate': 24000, 'channels': 1, 'bitrate': 32000},
+    },
+    'voice': {
+        'name': 'Голосовое Opus, 24 кбит/с',
+        'format': 'ogg',
+        'send': 'voice',
+        'args': ['-c:a', 'libopus', '-ac', '1', '-b:a', '24k', '-application', 'audio',
+                 '-compression_level', '0', '-frame_duration', '60', '-f', 'ogg'],
+    },
 }
 
 # Доступные направления перевода
@@ -45,91 +235,1932 @@ TRANSLATION_DIRECTIONS = {
         'source': 'en',
         'target': 'ru',
         'label': 'VOCABULARY',
-        'example': 'apple - яблоко\ncat - кот\nbook - книга'
+        'example': 'apple - яблоко\ncat - кот\nbook - книга',
+        'tts': TTS_BACKEND
     },
     'en-uk': {
         'name': 'English → Українська',
         'source': 'en',
         'target': 'uk',
         'label': 'VOCABULARY',
-        'example': 'apple - яблуко\ncat - кіт\nbook - книга'
+        'example': 'apple - яблуко\ncat - кіт\nbook - книга',
+        'tts': TTS_BACKEND
     }
 }
 
+class Metrics:
+    """Счётчики и гистограммы длительностей в памяти процесса"""
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self):
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._sources = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _labels(labels):
+        return tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        """Увеличить счётчик"""
+        key = (name, self._labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        """Добавить значение в гистограмму"""
+        key = (name, self._labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.BUCKETS), 0.0, 0]
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Замер длительности блока в гистограмму name"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def gauge(self, name, func):
+        """Показатель, вычисляемый при каждом чтении метрик"""
+        self._gauges[name] = func
+
+    def snapshot(self):
+        """Счётчики и гистограммы процесса в виде, пригодном для JSON"""
+        with self._lock:
+            return {
+                'counters': [
+                    [name, list(labels), value]
+                    for (name, labels), value in self._counters.items()
+                ],
+                'histograms': [
+                    [name, list(labels), list(h[0]), h[1], h[2]]
+                    for (name, labels), h in self._histograms.items()
+                ],
+            }
+
+    def add_source(self, func):
+        """Метрики других процессов: func() -> [(метки, snapshot())]"""
+        self._sources.append(func)
+
+    def _collect(self):
+        """Свои метрики и метрики источников с их дополнительными метками"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(h[0]), h[1], h[2]) for key, h in self._histograms.items()}
+
+        for func in self._sources:
+            try:
+                snapshots = func()
+            except Exception as e:
+                logger.warning(f"Metrics source failed: {e}")
+                continue
+            for extra, snapshot in snapshots:
+                extra = list(extra.items())
+                for name, labels, value in snapshot['counters']:
+                    labels = tuple(sorted([tuple(item) for item in labels] + extra))
+                    counters[(name, labels)] = value
+                for name, labels, buckets, total, count in snapshot['histograms']:
+                    labels = tuple(sorted([tuple(item) for item in labels] + extra))
+                    histograms[(name, labels)] = (buckets, total, count)
+        return counters, histograms
+
+    @staticmethod
+    def _format_labels(labels, extra=()):
+        items = list(labels) + list(extra)
+        if not items:
+            return ''
+        return '{' + ','.join(f'{key}="{value}"' for key, value in items) + '}'
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus"""
+        counters, histograms = self._collect()
+
+        lines = []
+        for (name, labels), value in sorted(counters.items()):
+            lines.append(f"{name}{self._format_labels(labels)} {value}")
+        for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+            for bound, bucket_count in zip(self.BUCKETS, buckets):
+                le = (('le', bound),)
+                lines.append(f"{name}_bucket{self._format_labels(labels, le)} {bucket_count}")
+            inf = (('le', '+Inf'),)
+            lines.append(f"{name}_bucket{self._format_labels(labels, inf)} {count}")
+            lines.append(f"{name}_sum{self._format_labels(labels)} {total}")
+            lines.append(f"{name}_count{self._format_labels(labels)} {count}")
+        for name, func in sorted(self._gauges.items()):
+            try:
+                lines.append(f"{name} {func()}")
+            except Exception as e:
+                logger.warning(f"Metric {name} failed: {e}")
+        return '\n'.join(lines) + '\n'
+
+    def _quantile(self, buckets, count, q):
+        rank = q * count
+        for bound, bucket_count in zip(self.BUCKETS, buckets):
+            if bucket_count >= rank:
+                return bound
+        return float('inf')
+
+    def summary(self):
+        """Краткая сводка для периодического лога"""
+        counters, histograms = self._collect()
+
+        parts = []
+        for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+            label = ','.join(f"{key}={value}" for key, value in labels)
+            parts.append(
+                f"{name}{{{label}}}: n={count} avg={total / count:.3f}s "
+                f"p95<={self._quantile(buckets, count, 0.95)}s"
+            )
+        for (name, labels), value in sorted(counters.items()):
+            label = ','.join(f"{key}={value}" for key, value in labels)
+            parts.append(f"{name}{{{label}}}={value}")
+        for name, func in sorted(self._gauges.items()):
+            try:
+                parts.append(f"{name}={func()}")
+            except Exception:
+                pass
+        return '; '.join(parts)
+
+metrics = Metrics()
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """GET /metrics для Prometheus"""
+
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    """HTTP-сервер метрик в фоновом потоке"""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics', daemon=True)
+    thread.start()
+    logger.info(f"Metrics endpoint: http://{host}:{port}/metrics")
+    return server
+
+async def log_metrics_periodically():
+    """Периодическая сводка метрик в лог"""
+    while True:
+        await asyncio.sleep(METRICS_LOG_SEC)
+        logger.info(f"Metrics: {metrics.summary()}")
+
+def open_database(path=BOT_DB_PATH):
+    """Подключение к SQLite в режиме WAL"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+class MemorySettingsBackend:
+    """Настройки в памяти процесса (без сохранения между перезапусками)"""
+
+    def __init__(self):
+        self._data = {}
+
+    def load(self, user_id):
+        settings = self._data.get(user_id)
+        return dict(settings) if settings is not None else None
+
+    def save_many(self, items):
+        for user_id, settings in items:
+            self._data[user_id] = dict(settings)
+
+class SQLiteSettingsBackend:
+    """Настройки в SQLite"""
+
+    def __init__(self, path=BOT_DB_PATH):
+        self._conn = open_database(path)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS user_settings ('
+                'user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)'
+            )
+
+    def load(self, user_id):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT data FROM user_settings WHERE user_id = ?', (user_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_many(self, items):
+        now = time.time()
+        rows = [(user_id, json.dumps(settings), now) for user_id, settings in items]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT INTO user_settings (user_id, data, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, '
+                'updated_at = excluded.updated_at',
+                rows
+            )
+
+class SettingsStore:
+    """Настройки пользователей: LRU в памяти поверх хранилища.
+
+    Настройки загружаются при первом обращении, изменения помечаются
+    через mark_dirty() и записываются пачкой в flush().
+    """
+
+    def __init__(self, backend, cache_size=SETTINGS_CACHE_SIZE):
+        self.backend = backend
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """Настройки пользователя (изменяемый словарь)"""
+        with self._lock:
+            settings = self._cache.get(user_id)
+            if settings is not None:
+                self._cache.move_to_end(user_id)
+                return settings
+
+        stored = self.backend.load(user_id) or {}
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(stored)
+
+        with self._lock:
+            # Другой поток мог загрузить настройки раньше нас
+            settings = self._cache.setdefault(user_id, settings)
+            self._cache.move_to_end(user_id)
+            self._evict()
+        return settings
+
+    def mark_dirty(self, user_id):
+        """Пометить настройки пользователя для записи"""
+        with self._lock:
+            if user_id in self._cache:
+                self._dirty.add(user_id)
+
+    def _evict(self):
+        # Несохранённые настройки не вытесняются до следующего flush()
+        for user_id in list(self._cache):
+            if len(self._cache) <= self.cache_size:
+                break
+            if user_id not in self._dirty:
+                del self._cache[user_id]
+
+    def flush(self):
+        """Записать изменённые настройки в хранилище"""
+        with self._lock:
+            items = [(user_id, dict(self._cache[user_id])) for user_id in self._dirty]
+            self._dirty.clear()
+        if not items:
+            return
+        try:
+            self.backend.save_many(items)
+        except Exception:
+            with self._lock:
+                self._dirty.update(user_id for user_id, _ in items)
+            raise
+        with self._lock:
+            self._evict()
+
+def create_settings_store():
+    """Хранилище настроек по SETTINGS_BACKEND"""
+    if SETTINGS_BACKEND == 'memory':
+        backend = MemorySettingsBackend()
+    else:
+        backend = SQLiteSettingsBackend(BOT_DB_PATH)
+    return SettingsStore(backend, SETTINGS_CACHE_SIZE)
+
+settings_store = None
+
 def get_user_settings(user_id):
     """Получить настройки пользователя"""
-    if user_id not in user_settings:
-        user_settings[user_id] = DEFAULT_SETTINGS.copy()
-    return user_settings[user_id]
-
-def parse_word_pairs(text):
-    """Парсинг пар слов из текста"""
-    pairs = []
-    for line in text.strip().split('\n'):
-        line = line.strip()
-        if not line:
+    global settings_store
+    if settings_store is None:
+        settings_store = create_settings_store()
+    return settings_store.get(user_id)
+
+def save_user_settings(user_id):
+    """Отметить изменение настроек для пакетной записи"""
+    if settings_store is not None:
+        settings_store.mark_dirty(user_id)
+
+async def flush_settings_periodically():
+    """Фоновая пакетная запись настроек и статистики слов"""
+    while True:
+        await asyncio.sleep(SETTINGS_FLUSH_SEC)
+        try:
+            await asyncio.to_thread(word_stats.flush)
+        except Exception as e:
+            logger.error(f"Word stats flush failed: {e}")
+        if settings_store is None:
+            continue
+        try:
+            await asyncio.to_thread(settings_store.flush)
+        except Exception as e:
+            logger.error(f"Settings flush failed: {e}")
+
+# Разделители пары в порядке приоритета: из строки с несколькими
+# разделителями берётся первый по приоритету, поэтому "e=mc2 - формула"
+# и "re: subject - тема" делятся по дефису. Дефис — только в пробелах
+# ("well-known" — одно слово), двоеточие — только с пробелом после
+# ("12:30" — не разделитель). Если слово по разделителю получается
+# пустым ("- яблоко"), строка проверяется следующим.
+PAIR_SEPARATORS = (' - ', '\t', '—', '–', ': ', '=', '|')
+
+# Дефис между табуляциями или табуляцией и пробелом
+_TAB_DASH_RE = re.compile(r'[ \t]-[ \t]')
+
+# Нумерация строк списка: "1." или "1)". Выражение начинается с
+# перевода строки, поэтому по тексту без нумерации проходит быстро
+_LINE_NUMBER_RE = re.compile(r'\n[ \t]*+\d{1,4}[.)][ \t]++')
+
+# Строка сообщения похожа на CSV, если разделитель стоит вплотную
+# к следующему полю ("book,книга") или поле в кавычках; прозу вроде
+# "Hello, world" разбирать как пару не нужно
+_CSV_LINE_RE = re.compile(r'^"|[,;](?=[^\s,;])')
+
+# Размер блока при чтении файла со словами, символов
+DOCUMENT_BLOCK_CHARS = 64 * 1024
+
+def _clean_word(text):
+    """Схлопнуть пробелы и снять кавычки вокруг слова"""
+    text = text.strip()
+    if '  ' in text or '\xa0' in text:
+        text = ' '.join(text.split())
+    if len(text) >= 2 and text[0] == text[-1] == '"':
+        text = text[1:-1].strip()
+    return text
+
+def _split_csv_line(line):
+    """Пара из строки CSV ("apple,яблоко" или "apple;яблоко")"""
+    delimiter = ';' if ';' in line else ','
+    if '"' in line:
+        try:
+            fields = next(csv.reader([line], delimiter=delimiter, skipinitialspace=True))
+        except (csv.Error, StopIteration):
+            return None
+    else:
+        fields = line.split(delimiter)
+    fields = [field for field in fields if field.strip()]
+    if len(fields) < 2:
+        return None
+    return fields[0], fields[1]
+
+def _split_pair(line, separators, clean, csv_lines=False):
+    """Пара из строки по разделителям в порядке приоритета или как CSV.
+
+    None — в строке нет пары слов.
+    """
+    for separator in separators:
+        source, found, target = line.partition(separator)
+        if not found:
             continue
+        if separator == '\t':
+            # Вставка из таблицы: лишние колонки отбрасываются
+            target = target.lstrip('\t ').partition('\t')[0]
+        source = clean(source)
+        target = clean(target)
+        if source and target:
+            return source, target
+    if (',' in line or ';' in line) and (csv_lines or _CSV_LINE_RE.search(line)):
+        split = _split_csv_line(line)
+        if split is not None:
+            source = clean(split[0])
+            target = clean(split[1])
+            if source and target:
+                return source, target
+    return None
+
+def parse_word_pairs(text, skipped=None, seen=None, csv_lines=False):
+    """Пары слов из текста без повторов.
+
+    Поддерживаются нумерация, вставки из таблиц (табуляция) и CSV: в
+    файлах (csv_lines) — любая строка с "," или ";", в сообщениях —
+    только похожая на CSV. Нераспознанные непустые строки добавляются в
+    список skipped; seen — общее множество уже найденных пар, если
+    текст разбирается частями.
+    """
+    if '\xa0' in text:
+        text = text.replace('\xa0', ' ')
+    if '\t' in text:
+        text = _TAB_DASH_RE.sub(' - ', text)
+    if '.' in text or ')' in text:
+        text = _LINE_NUMBER_RE.sub('\n', '\n' + text)
+    # Сначала проверяется символ: поиск отсутствующей подстроки дольше
+    separators = [
+        separator for separator in PAIR_SEPARATORS
+        if (separator.strip() or separator) in text and separator in text
+    ]
+    # Слова чистятся, только если в тексте есть что чистить
+    clean = _clean_word if '"' in text or '  ' in text else str.strip
+    # Главный разделитель проверяется прямо в цикле: в обычном списке он
+    # есть в каждой строке. Табуляция и остальные строки разбираются
+    # _split_pair; "\n" в строке не встречается
+    primary = separators[0] if separators and separators[0] != '\t' else '\n'
+
+    # Ключи словаря — пары в порядке появления, без повторов
+    keys = {}
+    for line in text.split('\n'):
+        source, found, target = line.partition(primary)
+        if found:
+            source = clean(source)
+            target = clean(target)
+        if not (found and source and target):
+            line = line.strip()
+            if not line:
+                continue
+            pair = _split_pair(line, separators, clean, csv_lines)
+            if pair is None:
+                if skipped is not None:
+                    skipped.append(line)
+                continue
+            source, target = pair
+
+        # Регистр учитывается в ключах кэша, здесь достаточно точного совпадения
+        keys[source, target] = None
+
+    if seen is not None:
+        if seen:
+            keys = [key for key in keys if key not in seen]
+        seen.update(keys)
+    return [{'source': source, 'target': target} for source, target in keys]
+
+def normalize_clip_text(text):
+    """Текст клипа в том виде, в каком он входит в ключ кэша"""
+    return ' '.join(text.split()).lower()
+
+class ClipCache:
+    """Двухуровневый кэш аудио: LRU в памяти + LRU на диске"""
+
+    def __init__(self, directory, max_bytes, memory_items, suffix='.mp3',
+                 memory_bytes=None):
+        self.directory = directory
+        self.suffix = suffix
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self.memory_bytes = memory_bytes
+        self._memory_size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = None
+
+    @staticmethod
+    def make_key(text, lang, version, slow=False):
+        """Ключ клипа: версия движка, язык, нормализованный текст, скорость"""
+        raw = f"{version}\0{lang}\0{normalize_clip_text(text)}\0{int(slow)}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + self.suffix)
+
+    def _remember(self, key, data):
+        old = self._memory.get(key)
+        if old is not None:
+            self._memory_size -= len(old)
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        self._memory_size += len(data)
+        while self._memory and (
+            len(self._memory) > self.memory_items
+            or (self.memory_bytes is not None and self._memory_size > self.memory_bytes)
+        ):
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def get(self, key):
+        """Получить клип или None"""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return data
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # Обновляем mtime — по нему работает LRU-вытеснение на диске
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self._remember(key, data)
+            self.hits += 1
+            self.disk_hits += 1
+        return data
+
+    def contains(self, key):
+        """Есть ли клип в кэше (без чтения и учёта попаданий)"""
+        with self._lock:
+            if key in self._memory:
+                return True
+        return os.path.exists(self._path(key))
+
+    def put(self, key, data, memory=True):
+        """Сохранить клип в память и на диск"""
+        if memory:
+            with self._lock:
+                self._remember(key, data)
+
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Clip cache write failed: {e}")
+            return
+
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_size()
+            else:
+                self._disk_bytes += len(data)
+            if self._disk_bytes > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(self.suffix):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield st.st_mtime, st.st_size, path
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        """Удалить самые давно использованные клипы до 90% лимита"""
+        target = self.max_bytes * 0.9
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
+        self._disk_bytes = total
+
+    def stats(self):
+        """Счётчики попаданий и промахов"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'memory_items': len(self._memory),
+                'memory_bytes': self._memory_size,
+            }
+
+clip_cache = ClipCache(
+    CLIP_CACHE_DIR,
+    CLIP_CACHE_MAX_MB * 1024 * 1024,
+    CLIP_CACHE_MEMORY_ITEMS,
+    suffix='.clip',
+    memory_bytes=CLIP_CACHE_MEMORY_MB * 1024 * 1024
+)
+
+track_cache = ClipCache(
+    TRACK_CACHE_DIR,
+    TRACK_CACHE_MAX_MB * 1024 * 1024,
+    TRACK_CACHE_MEMORY_ITEMS
+)
+
+def get_output_name(settings):
+    """Профиль итогового файла из настроек (неизвестный — по умолчанию)"""
+    name = settings.get('output', DEFAULT_SETTINGS['output'])
+    return name if name in OUTPUT_PROFILES else DEFAULT_SETTINGS['output']
+
+def make_track_key(pairs, settings, direction='en-ru'):
+    """Ключ готового трека: пары слов, направление и настройки"""
+    raw = json.dumps({
+        'version': clip_version(get_tts_backend(direction)),
+        'pairs': [
+            [pair['source'].casefold(), pair['target'].casefold()]
+            for pair in pairs
+        ],
+        'direction': direction,
+        'repeat_count': settings['repeat_count'],
+        'pause_ms': settings['pause_ms'],
+        'output': get_output_name(settings),
+        'profile': OUTPUT_PROFILES[get_output_name(settings)]['args'],
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+class FileIdStore:
+    """Telegram file_id уже загруженных файлов: повторно байты не отправляются"""
+
+    def __init__(self, path=BOT_DB_PATH):
+        self.path = path
+        self._conn = None
+        self._memory = {}
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = open_database(self.path)
+            with self._conn:
+                self._conn.execute(
+                    'CREATE TABLE IF NOT EXISTS file_ids ('
+                    'key TEXT PRIMARY KEY, file_id TEXT NOT NULL, duration REAL)'
+                )
+        return self._conn
+
+    def get(self, key):
+        """(file_id, длительность) или None"""
+        with self._lock:
+            if key in self._memory:
+                return self._memory[key]
+            row = self._connect().execute(
+                'SELECT file_id, duration FROM file_ids WHERE key = ?', (key,)
+            ).fetchone()
+            if row:
+                self._memory[key] = (row[0], row[1])
+                return self._memory[key]
+        return None
+
+    def put(self, key, file_id, duration=None):
+        with self._lock:
+            self._memory[key] = (file_id, duration)
+            with self._connect() as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO file_ids (key, file_id, duration) VALUES (?, ?, ?)',
+                    (key, file_id, duration)
+                )
+
+    def delete(self, key):
+        with self._lock:
+            self._memory.pop(key, None)
+            with self._connect() as conn:
+                conn.execute('DELETE FROM file_ids WHERE key = ?', (key,))
+
+file_ids = FileIdStore(BOT_DB_PATH)
+
+class WordStats:
+    """Частота запросов слов по языкам — для прогрева кэша клипов.
+
+    Счётчики копятся в памяти и записываются пачкой в flush().
+    """
+
+    def __init__(self, path=BOT_DB_PATH):
+        self.path = path
+        self._conn = None
+        self._pending = Counter()
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = open_database(self.path)
+            with self._conn:
+                self._conn.execute(
+                    'CREATE TABLE IF NOT EXISTS word_stats ('
+                    'lang TEXT NOT NULL, text TEXT NOT NULL, count INTEGER NOT NULL, '
+                    'updated_at REAL NOT NULL, PRIMARY KEY (lang, text))'
+                )
+        return self._conn
+
+    def record(self, pairs, direction='en-ru'):
+        """Учесть слова принятой задачи"""
+        words = [
+            (normalize_clip_text(text), lang)
+            for text, lang in build_synthesis_plan(pairs, direction)
+        ]
+        with self._lock:
+            self._pending.update(words)
+
+    def flush(self):
+        """Записать накопленные счётчики в SQLite"""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        if not pending:
+            return
+        now = time.time()
+        rows = [(lang, text, count, now) for (text, lang), count in pending.items()]
+        try:
+            with self._lock, self._connect() as conn:
+                conn.executemany(
+                    'INSERT INTO word_stats (lang, text, count, updated_at) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT(lang, text) DO UPDATE SET '
+                    'count = word_stats.count + excluded.count, '
+                    'updated_at = excluded.updated_at',
+                    rows
+                )
+        except Exception:
+            with self._lock:
+                self._pending.update(pending)
+            raise
+
+    def top(self, limit):
+        """Самые частые слова: список (текст, язык)"""
+        with self._lock:
+            rows = self._connect().execute(
+                'SELECT text, lang FROM word_stats ORDER BY count DESC LIMIT ?', (limit,)
+            ).fetchall()
+        return [(text, lang) for text, lang in rows]
+
+word_stats = WordStats(BOT_DB_PATH)
+
+def build_synthesis_plan(pairs, direction='en-ru'):
+    """Список уникальных клипов (текст, язык) для запроса.
+
+    Клипы сравниваются так же, как в ключе кэша: "Apple" и "apple"
+    дают один клип, в план попадает первое написание.
+    """
+    dir_info = TRANSLATION_DIRECTIONS[direction]
+    plan = []
+    seen = set()
+    for pair in pairs:
+        for text, lang in ((pair['source'], dir_info['source']),
+                           (pair['target'], dir_info['target'])):
+            clip_id = (normalize_clip_text(text), lang)
+            if clip_id not in seen:
+                seen.add(clip_id)
+                plan.append((text, lang))
+    return plan
+
+_tts_session = None
+_tts_executor = None
+_tts_lock = threading.Lock()
+# Остановка бота: клипы из очереди пула синтеза больше не создаются
+_tts_stopping = threading.Event()
+
+def get_tts_session():
+    """Общая HTTP-сессия с пулом соединений для запросов к TTS"""
+    global _tts_session
+    with _tts_lock:
+        if _tts_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=4,
+                pool_maxsize=TTS_CONCURRENCY
+            )
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _tts_session = session
+        return _tts_session
+
+def get_tts_executor():
+    """Пул потоков для параллельной загрузки клипов"""
+    global _tts_executor
+    with _tts_lock:
+        if _tts_executor is None:
+            _tts_executor = ThreadPoolExecutor(
+                max_workers=TTS_CONCURRENCY,
+                thread_name_prefix='tts'
+            )
+        return _tts_executor
+
+_GTTS_AUDIO_RE = re.compile(r'jQ1olc","\[\\"(.*)\\"]')
+
+def _send_tts_request(session, tts, prepared):
+    """Один запрос к gTTS с повторами при 429/5xx"""
+    for attempt in range(TTS_RETRIES + 1):
+        try:
+            response = session.send(
+                prepared,
+                timeout=tts.timeout,
+                proxies=urllib.request.getproxies()
+            )
+        except requests.exceptions.RequestException as e:
+            if attempt == TTS_RETRIES:
+                raise gTTSError(tts=tts) from e
+            delay = TTS_BACKOFF_SEC * 2 ** attempt
+        else:
+            if response.status_code == 429 or response.status_code >= 500:
+                if attempt == TTS_RETRIES:
+                    raise gTTSError(tts=tts, response=response)
+                retry_after = response.headers.get('Retry-After', '')
+                delay = float(retry_after) if retry_after.isdigit() else TTS_BACKOFF_SEC * 2 ** attempt
+                # Соединение возвращается в пул до повтора
+                response.close()
+            elif response.status_code >= 400:
+                raise gTTSError(tts=tts, response=response)
+            else:
+                return response
+        # Большой Retry-After не должен надолго занимать общий поток синтеза
+        delay = min(delay, TTS_MAX_RETRY_DELAY_SEC)
+        logger.warning(f"TTS request failed, retrying in {delay:.1f}s")
+        time.sleep(delay)
+
+class GTTSBackend:
+    """Google TTS через gTTS (сеть)"""
+
+    name = 'gtts'
+    version = 'gtts-2.5.0'
+    format = 'mp3'
+    sample_rate = 24000
+
+    def synthesize(self, text, lang):
+        """Синтез одного клипа, возвращает MP3-байты"""
+        tts = gTTS(text=text, lang=lang, slow=False)
+        session = get_tts_session()
+        output = io.BytesIO()
+
+        # gTTS открывает новое соединение на каждый запрос,
+        # поэтому отправляем подготовленные им запросы через общую сессию
+        for prepared in tts._prepare_requests():
+            response = _send_tts_request(session, tts, prepared)
+            for line in response.iter_lines(chunk_size=1024):
+                decoded_line = line.decode('utf-8')
+                if 'jQ1olc' in decoded_line:
+                    match = _GTTS_AUDIO_RE.search(decoded_line)
+                    if not match:
+                        raise gTTSError(tts=tts, response=response)
+                    output.write(base64.b64decode(match.group(1).encode('ascii')))
+
+        return output.getvalue()
+
+class EspeakBackend:
+    """Локальный синтез через espeak-ng (без сети)"""
+
+    name = 'espeak'
+    version = 'espeak-ng'
+    format = 'wav'
+    sample_rate = 22050
+
+    def synthesize(self, text, lang):
+        """Синтез одного клипа, возвращает WAV-байты"""
+        # Текст передаётся через stdin: слова вроде "-ing" не станут опциями
+        process = subprocess.run(
+            [ESPEAK_BINARY, '-v', lang, '--stdout', '--stdin'],
+            input=text.encode('utf-8'),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        if process.returncode != 0:
+            raise RuntimeError(
+                f"espeak-ng failed: {process.stderr.decode('utf-8', 'replace').strip()}"
+            )
+        return process.stdout
+
+class StubBackend:
+    """Детерминированная заглушка: тон, зависящий от текста.
+
+    Не требует сети и внешних программ — для бенчмарков и тестов.
+    """
+
+    name = 'stub'
+    version = 'stub-1'
+    format = 'wav'
+    sample_rate = AUDIO_FRAME_RATE
+
+    def synthesize(self, text, lang):
+        """Синтез одного клипа, возвращает WAV-байты"""
+        if TTS_STUB_LATENCY_MS:
+            time.sleep(TTS_STUB_LATENCY_MS / 1000)
+
+        digest = hashlib.sha256(f"{lang}\0{text}".encode('utf-8')).digest()
+        frequency = 200 + int.from_bytes(digest[:2], 'big') % 600
+        duration_ms = min(300 + 60 * len(text), 2000)
+
+        # Один период тона размножается до нужной длины
+        period = max(1, self.sample_rate // frequency)
+        wave_period = array.array('h', (
+            int(8000 * math.sin(2 * math.pi * i / period)) for i in range(period)
+        ))
+        frames = self.sample_rate * duration_ms // 1000
+        samples = (wave_period * (frames // period + 1))[:frames]
+
+        output = io.BytesIO()
+        with wave.open(output, 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(self.sample_rate)
+            wav.writeframes(samples.tobytes())
+        return output.getvalue()
+
+TTS_BACKENDS = {
+    'gtts': GTTSBackend,
+    'espeak': EspeakBackend,
+    'stub': StubBackend,
+}
+
+_tts_backends = {}
+
+def get_tts_backend(direction='en-ru'):
+    """Движок синтеза для направления перевода"""
+    name = TRANSLATION_DIRECTIONS[direction].get('tts', TTS_BACKEND)
+    backend = _tts_backends.get(name)
+    if backend is None:
+        backend = _tts_backends.setdefault(name, TTS_BACKENDS[name]())
+    return backend
+
+def synthesize_timed(backend, text, lang):
+    """Синтез клипа с замером времени и учётом ошибок"""
+    try:
+        with metrics.timer('bot_tts_fetch_seconds', backend=backend.name):
+            data = backend.synthesize(text, lang)
+    except Exception:
+        metrics.inc('bot_tts_requests_total', backend=backend.name, result='error')
+        raise
+    metrics.inc('bot_tts_requests_total', backend=backend.name, result='ok')
+    return data
+
+def clip_version(backend):
+    """Версия клипов в кэше: движок и параметры подготовки"""
+    if not CLIP_PREPARE:
+        return backend.version
+    return (
+        f"{backend.version}/prepared-mp3:{CLIP_SILENCE_DBFS:g}:{CLIP_EDGE_MS}:"
+        f"{CLIP_TARGET_DBFS:g}:{AUDIO_FRAME_RATE}"
+    )
+
+def synthesize_clip(backend, text, lang):
+    """Синтез клипа движком (подготовка — prepare_clips)"""
+    if _tts_stopping.is_set():
+        raise RuntimeError("Bot is stopping")
+    return synthesize_timed(backend, text, lang)
+
+def clip_format(backend):
+    """Формат клипов движка в кэше"""
+    return 'mp3' if CLIP_PREPARE else backend.format
+
+def prepare_clips(clips, backend):
+    """Подготовка новых клипов для кэша (при CLIP_PREPARE).
+
+    Клипы обрабатываются пачками по CLIP_PREPARE_BATCH: пачка
+    декодируется одним запуском ffmpeg, клипы обрезаются и выравниваются
+    по одному, а затем кодируются обратно в MP3 формата gTTS ещё одним
+    запуском.
+    """
+    if not CLIP_PREPARE or not clips:
+        return clips
+    keys = list(clips)
+    batch_size = max(1, CLIP_PREPARE_BATCH)
+    result = {}
+    with metrics.timer('bot_stage_seconds', stage='prepare'):
+        for start in range(0, len(keys), batch_size):
+            batch = {key: clips[key] for key in keys[start:start + batch_size]}
+            pcm = decode_clips(batch, backend.format)
+            result.update(encode_mp3_clips({key: prepare_clip(data) for key, data in pcm.items()}))
+    return result
+
+def fetch_clips(plan, backend):
+    """Загрузка клипов плана: из кэша или параллельно из движка TTS.
+
+    Генератор выдаёт ((текст, язык), байты клипа в формате clip_format).
+    Без CLIP_PREPARE новые клипы выдаются по мере готовности, с ним —
+    после синтеза всех промахов, которые готовятся одним пакетом.
+    """
+    futures = {}
+    for text, lang in plan:
+        key = ClipCache.make_key(text, lang, clip_version(backend))
+        data = clip_cache.get(key)
+        if data is not None:
+            yield (text, lang), data
+        else:
+            future = get_tts_executor().submit(synthesize_clip, backend, text, lang)
+            futures[future] = (text, lang, key)
 
-        for sep in [' - ', ' — ', ' – ', ': ', ' : ', ' = ', ' | ']:
-            if sep in line:
-                parts = line.split(sep, 1)
-                if len(parts) == 2:
-                    pairs.append({
-                        'source': parts[0].strip(),
-                        'target': parts[1].strip()
-                    })
+    try:
+        if not CLIP_PREPARE:
+            for future in as_completed(futures):
+                text, lang, key = futures[future]
+                data = future.result()
+                clip_cache.put(key, data)
+                yield (text, lang), data
+            return
+        raw = {futures[future]: future.result() for future in as_completed(futures)}
+    finally:
+        for future in futures:
+            future.cancel()
+
+    for (text, lang, key), data in prepare_clips(raw, backend).items():
+        clip_cache.put(key, data)
+        yield (text, lang), data
+
+def expand_warmup_plan(words):
+    """(текст, язык) → (текст, язык, движок) для направлений с этим языком"""
+    plan = []
+    seen = set()
+    for text, lang in words:
+        for direction, dir_info in TRANSLATION_DIRECTIONS.items():
+            if lang not in (dir_info['source'], dir_info['target']):
+                continue
+            backend = get_tts_backend(direction)
+            if (text, lang, backend.name) not in seen:
+                seen.add((text, lang, backend.name))
+                plan.append((text, lang, backend))
+    return plan
+
+def warm_clips(plan, concurrency=TTS_CONCURRENCY, limit=None):
+    """Синтез в кэш клипов плана, которых там ещё нет.
+
+    Не больше limit клипов за вызов; прогретые клипы пишутся только на
+    диск, чтобы не вытеснять из памяти клипы текущих задач.
+    Возвращает (синтезировано, ошибок).
+    """
+    missing = []
+    keys = set()
+    for text, lang, backend in plan:
+        key = ClipCache.make_key(text, lang, clip_version(backend))
+        if key not in keys and not clip_cache.contains(key):
+            keys.add(key)
+            missing.append((text, lang, backend, key))
+            if limit is not None and len(missing) >= limit:
                 break
-    return pairs
+    if not missing:
+        return 0, 0
+
+    done = failed = 0
+    synthesized = {}
+    with ThreadPoolExecutor(max_workers=max(1, concurrency),
+                            thread_name_prefix='warmup') as executor:
+        futures = {
+            executor.submit(synthesize_clip, backend, text, lang): (text, lang, backend, key)
+            for text, lang, backend, key in missing
+        }
+        for future in as_completed(futures):
+            text, lang, backend, key = futures[future]
+            try:
+                data = future.result()
+            except Exception as e:
+                failed += 1
+                logger.warning(f"Warmup failed for {lang} '{text}': {e}")
+                continue
+            synthesized.setdefault(backend, {})[key] = data
+
+    # Клипы каждого движка готовятся одним пакетом
+    for backend, clips in synthesized.items():
+        try:
+            clips = prepare_clips(clips, backend)
+        except Exception as e:
+            failed += len(clips)
+            logger.warning(f"Warmup prepare failed for {backend.name}: {e}")
+            continue
+        for key, data in clips.items():
+            clip_cache.put(key, data, memory=False)
+            done += 1
+    metrics.inc('bot_warmup_clips_total', done, result='ok')
+    metrics.inc('bot_warmup_clips_total', failed, result='error')
+    return done, failed
+
+# Таблицы заголовков MPEG Audio Layer III
+_MP3_BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MP3_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),  # MPEG-1
+    2: (22050, 24000, 16000),  # MPEG-2
+    0: (11025, 12000, 8000),   # MPEG-2.5
+}
 
-def create_audio(pairs, settings, direction='en-ru'):
-    """Создание аудиофайла из пар слов"""
+Mp3Frame = namedtuple(
+    'Mp3Frame',
+    'offset size sample_rate samples channels bitrate version is_info'
+)
+
+def parse_mp3_header(data, offset):
+    """Разбор заголовка MP3-кадра по смещению, None если кадра нет"""
+    if offset + 4 > len(data) or data[offset] != 0xFF:
+        return None
+    b1, b2, b3 = data[offset + 1], data[offset + 2], data[offset + 3]
+    if b1 & 0xE0 != 0xE0:
+        return None
+
+    version = (b1 >> 3) & 3
+    layer = (b1 >> 1) & 3
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 3
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    mpeg1 = version == 3
+    protected = not (b1 & 1)
+    padding = (b2 >> 1) & 1
+    channels = 1 if b3 >> 6 == 3 else 2
+    bitrate = _MP3_BITRATES[1 if mpeg1 else 2][bitrate_index] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+    size = (144 if mpeg1 else 72) * bitrate // sample_rate + padding
+
+    # Кадр Xing/Info — служебный, звука в нём нет
+    if mpeg1:
+        side_info = 17 if channels == 1 else 32
+    else:
+        side_info = 9 if channels == 1 else 17
+    tag_offset = offset + 4 + (2 if protected else 0) + side_info
+    is_info = data[tag_offset:tag_offset + 4] in (b'Xing', b'Info')
+
+    return Mp3Frame(
+        offset, size, sample_rate, 1152 if mpeg1 else 576,
+        channels, bitrate, version, is_info
+    )
+
+def iter_mp3_frames(data):
+    """Перебор MP3-кадров, пропуская ID3-теги и мусор между кадрами"""
+    offset = 0
+    if data[:3] == b'ID3' and len(data) >= 10:
+        tag_size = 0
+        for byte in data[6:10]:
+            tag_size = (tag_size << 7) | (byte & 0x7F)
+        offset = 10 + tag_size
+
+    while offset + 4 <= len(data):
+        if data[offset:offset + 3] == b'TAG':
+            break
+        frame = parse_mp3_header(data, offset)
+        if frame is None:
+            offset += 1
+            continue
+        if offset + frame.size > len(data):
+            break
+        yield frame
+        offset += frame.size
+
+def build_mp3_frame(frame, bitrate=None, payload=b''):
+    """Служебный кадр в формате frame: нулевая side info и payload.
+
+    Кадр с нулевой side info декодируется как цифровая тишина.
+    """
+    mpeg1 = frame.version == 3
+    bitrate = bitrate or frame.bitrate
+    bitrate_index = _MP3_BITRATES[1 if mpeg1 else 2].index(bitrate // 1000)
+    rate_index = _MP3_SAMPLE_RATES[frame.version].index(frame.sample_rate)
+    size = (144 if mpeg1 else 72) * bitrate // frame.sample_rate
+    header = bytes([
+        0xFF,
+        0xE0 | (frame.version << 3) | (1 << 1) | 1,
+        (bitrate_index << 4) | (rate_index << 2),
+        0xC0 if frame.channels == 1 else 0x00,
+    ])
+    if mpeg1:
+        side_info = 17 if frame.channels == 1 else 32
+    else:
+        side_info = 9 if frame.channels == 1 else 17
+    body = bytes(side_info) + payload
+    if len(header) + len(body) > size:
+        return None
+    return header + body + bytes(size - len(header) - len(body))
+
+def build_xing_frame(frame, frame_count, byte_count):
+    """Кадр Xing с числом кадров и размером файла для верной длительности"""
+    payload = b'Xing' + (3).to_bytes(4, 'big') + frame_count.to_bytes(4, 'big')
+    payload += byte_count.to_bytes(4, 'big')
+    bitrates = _MP3_BITRATES[1 if frame.version == 3 else 2]
+    for kbps in bitrates[1:]:
+        if kbps * 1000 < frame.bitrate:
+            continue
+        data = build_mp3_frame(frame, kbps * 1000, payload)
+        if data is not None:
+            return data
+    return None
+
+def concat_mp3(pairs, clips, settings, direction='en-ru'):
+    """Сборка трека склейкой MP3-кадров, без декодирования.
+
+    clips — словарь (нормализованный текст, язык) -> MP3-байты. Паузы собираются из
+    кадров тишины того же формата. Возвращает (BytesIO, длительность
+    в секундах) или None, если клипы несовместимы между собой.
+    """
     dir_info = TRANSLATION_DIRECTIONS[direction]
     source_lang = dir_info['source']
     target_lang = dir_info['target']
 
-    combined = AudioSegment.empty()
-    pause = AudioSegment.silent(duration=settings['pause_ms'])
-    long_pause = AudioSegment.silent(duration=settings['pause_ms'] * 2)
+    frames = {}
+    reference = None
+    for key, data in clips.items():
+        audio_frames = [frame for frame in iter_mp3_frames(data) if not frame.is_info]
+        if not audio_frames:
+            return None
+        for frame in audio_frames:
+            if reference is None:
+                reference = frame
+            if (frame.version, frame.sample_rate, frame.channels) != \
+                    (reference.version, reference.sample_rate, reference.channels):
+                return None
+        frames[key] = (
+            b''.join(data[f.offset:f.offset + f.size] for f in audio_frames),
+            len(audio_frames)
+        )
+    if reference is None:
+        return None
+
+    pause = silence_pool.mp3(reference, settings['pause_ms'])
+    long_pause = silence_pool.mp3(reference, settings['pause_ms'] * 2)
+    if pause is None or long_pause is None:
+        return None
+
+    fragments = []
+    for pair in pairs:
+        # Исходное слово (повторить N раз)
+        audio_source = frames[(normalize_clip_text(pair['source']), source_lang)]
+        for i in range(settings['repeat_count']):
+            fragments.append(audio_source)
+            fragments.append(pause)
+
+        # Целевое слово (перевод)
+        fragments.append(frames[(normalize_clip_text(pair['target']), target_lang)])
+        fragments.append(long_pause)
+
+    body = b''.join(data for data, _ in fragments)
+    frame_count = sum(count for _, count in fragments)
+    xing = build_xing_frame(reference, frame_count, 0)
+    if xing is None:
+        return None
+    xing = build_xing_frame(reference, frame_count, len(xing) + len(body))
+
+    output = io.BytesIO()
+    output.write(xing)
+    output.write(body)
+    output.seek(0)
+    duration = frame_count * reference.samples / reference.sample_rate
+    return output, duration
+
+def mp3_duration(data):
+    """Длительность MP3 в секундах по заголовкам кадров"""
+    return sum(
+        frame.samples / frame.sample_rate
+        for frame in iter_mp3_frames(data)
+        if not frame.is_info
+    )
 
-    temp_files = []
+def ogg_opus_duration(data):
+    """Длительность Ogg Opus в секундах по позиции последней страницы"""
+    last_page = data.rfind(b'OggS')
+    head = data.find(b'OpusHead')
+    if last_page < 0 or head < 0:
+        return 0.0
+    granule = int.from_bytes(data[last_page + 6:last_page + 14], 'little')
+    pre_skip = int.from_bytes(data[head + 10:head + 12], 'little')
+    # Позиция в Opus всегда считается в отсчётах 48 кГц
+    return max(0, granule - pre_skip) / 48000
+
+def track_duration(data, output='mp3'):
+    """Длительность готового трека в секундах"""
+    if OUTPUT_PROFILES[output]['format'] == 'ogg':
+        return ogg_opus_duration(data)
+    return mp3_duration(data)
+
+def mp3_matches_profile(data, output):
+    """Все кадры MP3 уже в формате профиля output (можно не перекодировать)"""
+    profile = OUTPUT_PROFILES[output]
+    if profile['format'] != 'mp3':
+        return False
+    frames = [frame for frame in iter_mp3_frames(data) if not frame.is_info]
+    return bool(frames) and all(
+        getattr(frame, field) == value
+        for frame in frames
+        for field, value in profile['stream'].items()
+    )
 
+def encode_audio(data, output='mp3', input_format='pcm'):
+    """Кодирование трека под профиль одним запуском ffmpeg.
+
+    data — PCM формата сборки (input_format='pcm') или MP3 ('mp3').
+    """
+    if input_format == 'pcm':
+        input_args = ['-f', 's16le', '-ar', str(AUDIO_FRAME_RATE),
+                      '-ac', str(AUDIO_CHANNELS)]
+    else:
+        input_args = ['-f', input_format]
+    return run_ffmpeg(
+        input_args + ['-i', 'pipe:0'] + OUTPUT_PROFILES[output]['args'] + ['pipe:1'],
+        data
+    )
+
+def run_ffmpeg(args, input_data):
+    """Запуск ffmpeg с данными через stdin, возвращает stdout"""
+    metrics.inc('bot_ffmpeg_runs_total')
+    process = subprocess.run(
+        [AudioSegment.converter, '-hide_banner', '-loglevel', 'error'] + args,
+        input=input_data,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    if process.returncode != 0:
+        raise RuntimeError(
+            f"ffmpeg failed: {process.stderr.decode('utf-8', 'replace').strip()}"
+        )
+    return process.stdout
+
+def run_ffmpeg_pipes(inputs, output_count, make_args):
+    """Запуск ffmpeg с несколькими входами и выходами через каналы.
+
+    inputs — байты для каждого входа; make_args(входы, выходы) строит
+    аргументы по адресам каналов вида pipe:N. Каналы обслуживаются
+    одним циклом select, без временных файлов. Возвращает список байтов
+    выходов.
+    """
+    metrics.inc('bot_ffmpeg_runs_total')
+    input_pipes = [os.pipe() for _ in inputs]
+    output_pipes = [os.pipe() for _ in range(output_count)]
+    child_fds = [read_fd for read_fd, _ in input_pipes] + [write_fd for _, write_fd in output_pipes]
     try:
-        for pair in pairs:
-            # Исходное слово (повторить N раз)
-            for i in range(settings['repeat_count']):
-                temp_source = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
-                temp_files.append(temp_source.name)
+        process = subprocess.Popen(
+            [AudioSegment.converter, '-hide_banner', '-loglevel', 'error', '-nostdin']
+            + make_args(
+                [f'pipe:{read_fd}' for read_fd, _ in input_pipes],
+                [f'pipe:{write_fd}' for _, write_fd in output_pipes]
+            ),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            pass_fds=child_fds
+        )
+    except BaseException:
+        for _, write_fd in input_pipes:
+            os.close(write_fd)
+        for read_fd, _ in output_pipes:
+            os.close(read_fd)
+        raise
+    finally:
+        for fd in child_fds:
+            os.close(fd)
+
+    selector = selectors.DefaultSelector()
+    pending = {}
+    chunks = {}
+    for (_, write_fd), data in zip(input_pipes, inputs):
+        os.set_blocking(write_fd, False)
+        pending[write_fd] = memoryview(data)
+        selector.register(write_fd, selectors.EVENT_WRITE)
+    stderr_fd = process.stderr.fileno()
+    for read_fd in [read_fd for read_fd, _ in output_pipes] + [stderr_fd]:
+        chunks[read_fd] = []
+        selector.register(read_fd, selectors.EVENT_READ)
 
-                tts_source = gTTS(text=pair['source'], lang=source_lang, slow=False)
-                tts_source.save(temp_source.name)
+    try:
+        while selector.get_map():
+            for key, _ in selector.select():
+                fd = key.fd
+                if fd in pending:
+                    try:
+                        written = os.write(fd, pending[fd][:65536])
+                    except BrokenPipeError:
+                        written = len(pending[fd])
+                    pending[fd] = pending[fd][written:]
+                    if not pending[fd]:
+                        selector.unregister(fd)
+                        os.close(fd)
+                        del pending[fd]
+                else:
+                    chunk = os.read(fd, 65536)
+                    if chunk:
+                        chunks[fd].append(chunk)
+                    else:
+                        selector.unregister(fd)
+    except BaseException:
+        process.kill()
+        raise
+    finally:
+        selector.close()
+        for fd in pending:
+            os.close(fd)
+        for read_fd, _ in output_pipes:
+            os.close(read_fd)
+        process.wait()
+        process.stderr.close()
+
+    if process.returncode != 0:
+        stderr = b''.join(chunks[stderr_fd]).decode('utf-8', 'replace').strip()
+        raise RuntimeError(f"ffmpeg failed: {stderr}")
+    return [b''.join(chunks[read_fd]) for read_fd, _ in output_pipes]
+
+def decode_clip(data):
+    """Декодирование одного MP3-клипа в PCM формата сборки"""
+    return to_pcm(AudioSegment.from_file(io.BytesIO(data), format='mp3'))
+
+def decode_mp3_batch(clips):
+    """Декодирование всех MP3-клипов задачи одним запуском ffmpeg.
+
+    clips — словарь ключ -> MP3-байты. Кадры клипов склеиваются в один
+    поток, а PCM-результат режется по границам кадров. Если форматы
+    клипов различаются, каждый клип декодируется отдельно.
+    """
+    if not clips:
+        return {}
+
+    keys = list(clips)
+    streams = []
+    sample_counts = []
+    stream_format = None
+    for key in keys:
+        data = clips[key]
+        frames = [frame for frame in iter_mp3_frames(data) if not frame.is_info]
+        formats = {(frame.sample_rate, frame.channels) for frame in frames}
+        if len(formats) != 1 or (stream_format and formats != {stream_format}):
+            return {key: decode_clip(clips[key]) for key in keys}
+        stream_format = formats.pop()
+        streams.append(b''.join(data[f.offset:f.offset + f.size] for f in frames))
+        sample_counts.append(sum(frame.samples for frame in frames))
+
+    pcm = run_ffmpeg(
+        ['-f', 'mp3', '-i', 'pipe:0',
+         '-f', 's16le', '-acodec', 'pcm_s16le',
+         '-ac', str(AUDIO_CHANNELS), '-ar', str(AUDIO_FRAME_RATE), 'pipe:1'],
+        b''.join(streams)
+    )
 
-                audio_source = AudioSegment.from_mp3(temp_source.name)
-                combined += audio_source + pause
+    frame_width = AUDIO_CHANNELS * AUDIO_SAMPLE_WIDTH
+    scale = AUDIO_FRAME_RATE / stream_format[0]
+    result = {}
+    position = 0
+    start = 0
+    for key, samples in zip(keys, sample_counts):
+        position += samples
+        end = min(round(position * scale) * frame_width, len(pcm))
+        result[key] = pcm[start:end]
+        start = end
+    return result
+
+def decode_clips(clips, data_format):
+    """Декодирование клипов формата data_format в PCM формата сборки"""
+    if data_format == 'mp3':
+        return decode_mp3_batch(clips)
+    return {
+        key: to_pcm(AudioSegment.from_file(io.BytesIO(data), format=data_format))
+        for key, data in clips.items()
+    }
 
-            # Целевое слово (перевод)
-            temp_target = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
-            temp_files.append(temp_target.name)
+# Кодирование подготовленных клипов в формат gTTS (GTTS_MP3_FORMAT):
+# MPEG-2 Layer III, 24 кГц, моно, 32 кбит/с, без ID3 и Xing-кадра
+GTTS_MP3_ARGS = [
+    '-c:a', 'libmp3lame', '-ar', '24000', '-ac', '1', '-b:a', '32k',
+    '-id3v2_version', '0', '-write_xing', '0', '-f', 'mp3'
+]
+
+def encode_mp3_clips(clips):
+    """Кодирование PCM-клипов в MP3 формата gTTS одним запуском ffmpeg.
+
+    clips — словарь ключ -> PCM формата сборки. Каждый клип — отдельный
+    вход и выход ffmpeg через свой канал, поэтому кадры клипа не зависят
+    от соседей, а работа растёт линейно с числом клипов.
+    """
+    if not clips:
+        return {}
+
+    keys = list(clips)
+
+    def make_args(inputs, outputs):
+        args = []
+        for url in inputs:
+            args += ['-f', 's16le', '-ar', str(AUDIO_FRAME_RATE),
+                     '-ac', str(AUDIO_CHANNELS), '-i', url]
+        for index, url in enumerate(outputs):
+            args += ['-map', f'{index}:a'] + GTTS_MP3_ARGS + [url]
+        return args
+
+    outputs = run_ffmpeg_pipes([clips[key] for key in keys], len(keys), make_args)
+    return dict(zip(keys, outputs))
+
+def to_pcm(segment):
+    """Привести клип к формату сборки и вернуть сырые PCM-байты"""
+    return (
+        segment
+        .set_frame_rate(AUDIO_FRAME_RATE)
+        .set_channels(AUDIO_CHANNELS)
+        .set_sample_width(AUDIO_SAMPLE_WIDTH)
+        .raw_data
+    )
 
-            tts_target = gTTS(text=pair['target'], lang=target_lang, slow=False)
-            tts_target.save(temp_target.name)
+def prepare_clip(pcm):
+    """Обрезка тишины по краям и выравнивание громкости клипа.
+
+    Выполняется один раз при попадании клипа в кэш, поэтому пауза между
+    словами в треке равна pause_ms, а громкость слов одинакова.
+    Длительность готового клипа — len(pcm) / байт в секунду.
+    """
+    segment = AudioSegment(
+        data=pcm,
+        sample_width=AUDIO_SAMPLE_WIDTH,
+        frame_rate=AUDIO_FRAME_RATE,
+        channels=AUDIO_CHANNELS
+    )
+    start = detect_leading_silence(segment, CLIP_SILENCE_DBFS, chunk_size=5)
+    end = len(segment) - detect_leading_silence(segment.reverse(), CLIP_SILENCE_DBFS, chunk_size=5)
+    if end <= start:
+        return pcm
+    segment = segment[max(0, start - CLIP_EDGE_MS):min(len(segment), end + CLIP_EDGE_MS)]
+
+    # Громкость по RMS, но без клиппинга пиков
+    if segment.rms:
+        gain = min(CLIP_TARGET_DBFS - segment.dBFS, -1.0 - segment.max_dBFS)
+        segment = segment.apply_gain(gain)
+    return segment.raw_data
+
+def silence_pcm(duration_ms):
+    """PCM-тишина заданной длительности в формате сборки"""
+    frames = AUDIO_FRAME_RATE * duration_ms // 1000
+    return bytes(frames * AUDIO_CHANNELS * AUDIO_SAMPLE_WIDTH)
+
+class SilencePool:
+    """Готовые буферы тишины, общие для всех задач.
+
+    PCM-тишина в формате сборки и MP3-кадры тишины для каждого формата
+    клипов. Буферы для PAUSE_OPTIONS строятся при запуске, остальные —
+    при первом обращении.
+    """
+
+    def __init__(self):
+        self._pcm = {}
+        self._mp3 = {}
+        self._lock = threading.Lock()
+
+    def pcm(self, duration_ms):
+        """PCM-тишина заданной длительности"""
+        data = self._pcm.get(duration_ms)
+        if data is None:
+            data = silence_pcm(duration_ms)
+            with self._lock:
+                data = self._pcm.setdefault(duration_ms, data)
+        return data
+
+    def mp3(self, frame, duration_ms):
+        """(MP3-кадры тишины, число кадров) в формате frame или None"""
+        key = (frame.version, frame.sample_rate, frame.channels, frame.bitrate, duration_ms)
+        result = self._mp3.get(key)
+        if result is None:
+            silent_frame = build_mp3_frame(frame)
+            if silent_frame is None:
+                return None
+            frame_ms = frame.samples * 1000 / frame.sample_rate
+            count = max(1, round(duration_ms / frame_ms))
+            with self._lock:
+                result = self._mp3.setdefault(key, (silent_frame * count, count))
+        return result
+
+    def warm(self, durations, mp3_formats=()):
+        """Заранее построить буферы для durations"""
+        for duration_ms in durations:
+            self.pcm(duration_ms)
+            for frame in mp3_formats:
+                self.mp3(frame, duration_ms)
+
+# Формат клипов gTTS: MPEG-2 Layer III, 24 кГц, моно, 32 кбит/с
+GTTS_MP3_FORMAT = Mp3Frame(0, 96, 24000, 576, 1, 32000, 2, False)
+
+silence_pool = SilencePool()
+silence_pool.warm(
+    sorted({ms for pause in PAUSE_OPTIONS for ms in (pause, pause * 2)}),
+    [GTTS_MP3_FORMAT]
+)
 
-            audio_target = AudioSegment.from_mp3(temp_target.name)
-            combined += audio_target + long_pause
+def assemble_audio(pairs, clips, settings, direction='en-ru'):
+    """Сборка трека за один проход.
 
-        # Сохранение итогового файла
-        output = io.BytesIO()
-        combined.export(output, format='mp3', bitrate='128k')
-        output.seek(0)
+    clips — словарь (нормализованный текст, язык) -> PCM-байты. Фрагменты собираются
+    в список и склеиваются одним b''.join, без повторного копирования
+    накопленного трека на каждом клипе.
+    """
+    dir_info = TRANSLATION_DIRECTIONS[direction]
+    source_lang = dir_info['source']
+    target_lang = dir_info['target']
 
-        return output
+    pause = silence_pool.pcm(settings['pause_ms'])
+    long_pause = silence_pool.pcm(settings['pause_ms'] * 2)
+
+    fragments = []
+    for pair in pairs:
+        # Исходное слово (повторить N раз)
+        audio_source = clips[(normalize_clip_text(pair['source']), source_lang)]
+        for i in range(settings['repeat_count']):
+            fragments.append(audio_source)
+            fragments.append(pause)
+
+        # Целевое слово (перевод)
+        fragments.append(clips[(normalize_clip_text(pair['target']), target_lang)])
+        fragments.append(long_pause)
+
+    return AudioSegment(
+        data=b''.join(fragments),
+        sample_width=AUDIO_SAMPLE_WIDTH,
+        frame_rate=AUDIO_FRAME_RATE,
+        channels=AUDIO_CHANNELS
+    )
 
-    finally:
-        # Удаление временных файлов
-        for temp_file in temp_files:
-            try:
-                os.unlink(temp_file)
-            except:
-                pass
+def create_audio(pairs, settings, direction='en-ru'):
+    """Создание аудиофайла из пар слов.
+
+    Возвращает (BytesIO с файлом профиля из настроек, длительность в
+    секундах).
+    """
+    backend = get_tts_backend(direction)
+    output_name = get_output_name(settings)
+
+    # Каждый уникальный клип синтезируется один раз за запрос
+    plan = build_synthesis_plan(pairs, direction)
+    with metrics.timer('bot_stage_seconds', stage='fetch'):
+        raw_clips = {
+            (normalize_clip_text(text), lang): data
+            for (text, lang), data in fetch_clips(plan, backend)
+        }
+    logger.info(f"Clip cache: {clip_cache.stats()}")
+
+    # Быстрый путь: склейка MP3-кадров без перекодирования
+    if AUDIO_MP3_CONCAT and clip_format(backend) == 'mp3':
+        with metrics.timer('bot_stage_seconds', stage='concat'):
+            result = concat_mp3(pairs, raw_clips, settings, direction)
+        if result is not None:
+            concatenated, duration = result
+            if mp3_matches_profile(concatenated.getvalue(), output_name):
+                return result
+            # Склеенный MP3 перекодируется под профиль одним запуском ffmpeg
+            with metrics.timer('bot_stage_seconds', stage='encode'):
+                data = encode_audio(concatenated.getvalue(), output_name, input_format='mp3')
+            return io.BytesIO(data), track_duration(data, output_name) or duration
+        logger.info("MP3 clips are incompatible, falling back to re-encoding")
+
+    # MP3-клипы декодируются одним запуском ffmpeg
+    with metrics.timer('bot_stage_seconds', stage='decode'):
+        clips = decode_clips(raw_clips, clip_format(backend))
+    with metrics.timer('bot_stage_seconds', stage='assemble'):
+        combined = assemble_audio(pairs, clips, settings, direction)
+
+    # Сохранение итогового файла
+    with metrics.timer('bot_stage_seconds', stage='encode'):
+        data = encode_audio(combined.raw_data, output_name)
+
+    return io.BytesIO(data), len(combined) / 1000
+
+def build_track(pairs, settings, direction='en-ru'):
+    """Готовый трек из кэша треков или create_audio с сохранением в кэш"""
+    key = make_track_key(pairs, settings, direction)
+    data = track_cache.get(key)
+    if data is not None:
+        metrics.inc('bot_track_cache_total', result='hit')
+        return io.BytesIO(data), track_duration(data, get_output_name(settings))
+
+    metrics.inc('bot_track_cache_total', result='miss')
+    output, duration = create_audio(pairs, settings, direction)
+    track_cache.put(key, output.getvalue())
+    return output, duration
+
+class QueueFullError(Exception):
+    """Очередь генерации аудио переполнена"""
+
+class AudioJobQueue:
+    """Ограниченная очередь задач генерации аудио поверх пула воркеров"""
+
+    def __init__(self, workers, kind='thread', max_queue=20, per_user=1,
+                 position_interval=QUEUE_POSITION_INTERVAL_SEC):
+        self.workers = workers
+        self.kind = kind
+        self.max_queue = max_queue
+        self.per_user = per_user
+        self.position_interval = position_interval
+        self._executor = None
+        self._cond = asyncio.Condition()
+        self._waiting = []
+        self._running = 0
+        self._running_by_user = {}
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.kind == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix='audio'
+                )
+        return self._executor
+
+    def _can_start(self, token):
+        """Задача стартует, если она первая из тех, чей пользователь не занят"""
+        if self._running >= self.workers:
+            return False
+        for waiting_token, user_id in self._waiting:
+            if self._running_by_user.get(user_id, 0) < self.per_user:
+                return waiting_token is token
+        return False
+
+    def _position(self, token):
+        for index, (waiting_token, _) in enumerate(self._waiting, 1):
+            if waiting_token is token:
+                return index
+        return 0
+
+    @property
+    def depth(self):
+        """Количество ожидающих задач"""
+        return len(self._waiting)
+
+    @property
+    def running(self):
+        """Количество выполняющихся задач"""
+        return self._running
+
+    async def run(self, user_id, func, *args, on_position=None):
+        """Выполнить func(*args) в пуле, дождавшись своей очереди.
+
+        on_position получает номер в очереди сразу, а затем не чаще раза
+        в position_interval секунд — иначе каждое продвижение очереди
+        стоило бы каждому ожидающему запроса к Telegram.
+        """
+        if len(self._waiting) >= self.max_queue:
+            raise QueueFullError()
+
+        token = object()
+        self._waiting.append((token, user_id))
+        reported = None
+        next_report = 0
+        try:
+            while True:
+                async with self._cond:
+                    if self._can_start(token):
+                        self._waiting.remove((token, user_id))
+                        self._running += 1
+                        self._running_by_user[user_id] = self._running_by_user.get(user_id, 0) + 1
+                        break
+                    position = self._position(token)
+
+                report = on_position is not None and position != reported
+                now = time.monotonic()
+                if report and now >= next_report:
+                    reported = position
+                    next_report = now + self.position_interval
+                    try:
+                        await on_position(position)
+                    except Exception as e:
+                        logger.warning(f"Queue position update failed: {e}")
+                    continue
+
+                # Отложенное обновление номера отправится по таймауту
+                timeout = next_report - now if report else None
+                async with self._cond:
+                    if not self._can_start(token):
+                        try:
+                            await asyncio.wait_for(self._cond.wait(), timeout)
+                        except asyncio.TimeoutError:
+                            pass
+        except BaseException:
+            if (token, user_id) in self._waiting:
+                self._waiting.remove((token, user_id))
+                async with self._cond:
+                    self._cond.notify_all()
+            raise
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            async with self._cond:
+                self._running -= 1
+                self._running_by_user[user_id] -= 1
+                if not self._running_by_user[user_id]:
+                    del self._running_by_user[user_id]
+                self._cond.notify_all()
+
+    def shutdown(self):
+        """Остановить пул воркеров"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+audio_queue = AudioJobQueue(
+    AUDIO_WORKERS,
+    kind=AUDIO_POOL,
+    max_queue=AUDIO_QUEUE_SIZE,
+    per_user=AUDIO_JOBS_PER_USER
+)
+
+metrics.gauge('bot_audio_queue_depth', lambda: audio_queue.depth)
+metrics.gauge('bot_audio_jobs_running', lambda: audio_queue.running)
+metrics.gauge('bot_clip_cache_hits', lambda: clip_cache.stats()['hits'])
+metrics.gauge('bot_clip_cache_misses', lambda: clip_cache.stats()['misses'])
+
+class TokenBucket:
+    """Token bucket: rate токенов в минуту, запас не больше capacity.
+
+    Запрос больше capacity допускается при полном запасе, но списывается
+    целиком: запас уходит в минус, и следующие запросы ждут, пока долг
+    не восстановится, так что средний темп не превышает rate.
+    """
+
+    def __init__(self, rate_per_min, capacity=None):
+        self.rate = rate_per_min / 60
+        self.capacity = capacity or rate_per_min
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Сколько секунд ждать, пока наберётся amount токенов"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self.tokens -= amount
+
+class RateLimiter:
+    """Допуск задач: лимиты задач и пар слов в минуту на пользователя и на всех"""
+
+    def __init__(self, user_jobs, user_pairs, global_jobs, global_pairs, max_users=10000):
+        self.user_jobs = user_jobs
+        self.user_pairs = user_pairs
+        self.max_users = max_users
+        self._users = OrderedDict()
+        self._global = (TokenBucket(global_jobs), TokenBucket(global_pairs))
+
+    def _user_buckets(self, user_id):
+        buckets = self._users.get(user_id)
+        if buckets is None:
+            buckets = (TokenBucket(self.user_jobs), TokenBucket(self.user_pairs))
+            self._users[user_id] = buckets
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        self._users.move_to_end(user_id)
+        return buckets
+
+    def admit(self, user_id, pairs_count):
+        """0, если задача допущена, иначе сколько секунд подождать"""
+        jobs, pairs = self._user_buckets(user_id)
+        global_jobs, global_pairs = self._global
+        checks = ((jobs, 1), (pairs, pairs_count), (global_jobs, 1), (global_pairs, pairs_count))
+
+        retry_after = max(bucket.wait_time(amount) for bucket, amount in checks)
+        if retry_after > 0:
+            return retry_after
+        for bucket, amount in checks:
+            bucket.take(amount)
+        return 0
+
+rate_limiter = RateLimiter(
+    USER_JOBS_PER_MIN,
+    USER_PAIRS_PER_MIN,
+    GLOBAL_JOBS_PER_MIN,
+    GLOBAL_PAIRS_PER_MIN
+)
+
+class UserRateLimit:
+    """Лимит действий в минуту на пользователя и на всех"""
+
+    def __init__(self, user_per_min, global_per_min, max_users=10000):
+        self.user_per_min = user_per_min
+        self.max_users = max_users
+        self._users = OrderedDict()
+        self._global = TokenBucket(global_per_min)
+
+    def admit(self, user_id):
+        """0, если действие допущено, иначе сколько секунд подождать"""
+        bucket = self._users.get(user_id)
+        if bucket is None:
+            bucket = self._users[user_id] = TokenBucket(self.user_per_min)
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        self._users.move_to_end(user_id)
+
+        retry_after = max(bucket.wait_time(1), self._global.wait_time(1))
+        if retry_after > 0:
+            return retry_after
+        bucket.take(1)
+        self._global.take(1)
+        return 0
+
+# Синтез новых клипов для inline-режима не расходует лимиты задач
+inline_limiter = UserRateLimit(INLINE_USER_CLIPS_PER_MIN, INLINE_GLOBAL_CLIPS_PER_MIN)
+
+# Списки, аудио для которых сейчас создаётся: (user_id, ключ списка)
+in_flight_jobs = set()
+
+# Задачи из журнала, выполняющиеся в этом процессе
+_running_jobs = set()
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /start"""
@@ -163,6 +2194,7 @@ async def direction_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
     # Извлекаем направление из callback_data
     direction = query.data.split('_')[1]
     settings['direction'] = direction
+    save_user_settings(user_id)
 
     dir_info = TRANSLATION_DIRECTIONS[direction]
 
@@ -208,6 +2240,10 @@ async def settings_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         [InlineKeyboardButton(
             f"⏱️ Пауза: {settings['pause_ms']}мс",
             callback_data='change_pause'
+        )],
+        [InlineKeyboardButton(
+            f"🎧 Формат: {OUTPUT_PROFILES[get_output_name(settings)]['name']}",
+            callback_data='change_output'
         )]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -261,23 +2297,45 @@ async def settings_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
     elif query.data == 'change_pause':
-        keyboard = [
-            [InlineKeyboardButton("300мс", callback_data='pause_300'),
-             InlineKeyboardButton("500мс", callback_data='pause_500'),
-             InlineKeyboardButton("800мс", callback_data='pause_800')],
-            [InlineKeyboardButton("1000мс", callback_data='pause_1000'),
-             InlineKeyboardButton("1500мс", callback_data='pause_1500')],
-            [InlineKeyboardButton("« Назад", callback_data='back_settings')]
+        buttons = [
+            InlineKeyboardButton(f"{pause}мс", callback_data=f'pause_{pause}')
+            for pause in PAUSE_OPTIONS
         ]
+        keyboard = [buttons[i:i + 3] for i in range(0, len(buttons), 3)]
+        keyboard.append([InlineKeyboardButton("« Назад", callback_data='back_settings')])
         reply_markup = InlineKeyboardMarkup(keyboard)
         await query.edit_message_text(
             "⏱️ Пауза между словами:",
             reply_markup=reply_markup
         )
 
+    elif query.data == 'change_output':
+        keyboard = [
+            [InlineKeyboardButton(profile['name'], callback_data=f'output_{name}')]
+            for name, profile in OUTPUT_PROFILES.items()
+        ]
+        keyboard.append([InlineKeyboardButton("« Назад", callback_data='back_settings')])
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        await query.edit_message_text(
+            "🎧 Формат аудио:\n\n"
+            "Голосовое сообщение и MP3 для речи весят в несколько раз меньше "
+            "и быстрее загружаются на мобильном интернете.",
+            reply_markup=reply_markup
+        )
+
+    elif query.data.startswith('output_'):
+        name = query.data.split('_', 1)[1]
+        if name in OUTPUT_PROFILES:
+            settings['output'] = name
+            save_user_settings(user_id)
+            await query.edit_message_text(
+                f"✅ Установлено: {OUTPUT_PROFILES[name]['name']}"
+            )
+
     elif query.data.startswith('repeat_'):
         count = int(query.data.split('_')[1])
         settings['repeat_count'] = count
+        save_user_settings(user_id)
         await query.edit_message_text(
             f"✅ Установлено: {count}× повторений"
         )
@@ -285,6 +2343,7 @@ async def settings_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif query.data.startswith('pause_'):
         pause = int(query.data.split('_')[1])
         settings['pause_ms'] = pause
+        save_user_settings(user_id)
         await query.edit_message_text(
             f"✅ Установлено: {pause}мс пауза"
         )
@@ -299,7 +2358,9 @@ async def process_words(update: Update, context: ContextTypes.DEFAULT_TYPE):
     settings = get_user_settings(user_id)
 
     # Парсинг пар слов
-    pairs = parse_word_pairs(text)
+    skipped = []
+    with metrics.timer('bot_stage_seconds', stage='parse'):
+        pairs = parse_word_pairs(text, skipped)
 
     if not pairs:
         await update.message.reply_text(
@@ -310,50 +2371,390 @@ async def process_words(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
+    if skipped:
+        await update.message.reply_text(format_skipped_lines(skipped))
+
+    await submit_words_job(update.message, user_id, pairs, settings, MAX_PAIRS_PER_MESSAGE)
+
+async def process_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработка файла со словами (.txt, .csv, .tsv)"""
+    user_id = update.effective_user.id
+    document = update.message.document
+    settings = get_user_settings(user_id)
+
+    if document.file_size and document.file_size > MAX_DOCUMENT_MB * 1024 * 1024:
+        await update.message.reply_text(
+            f"❌ Файл слишком большой.\n\n"
+            f"Максимальный размер — {MAX_DOCUMENT_MB:g} МБ."
+        )
+        return
+
+    # Файл скачивается во временный файл и читается построчно
+    skipped = []
+    with tempfile.TemporaryFile() as buffer:
+        telegram_file = await document.get_file()
+        await telegram_file.download_to_memory(out=buffer)
+        with metrics.timer('bot_stage_seconds', stage='parse'):
+            pairs = await asyncio.to_thread(read_document_pairs, buffer, skipped)
+
+    if not pairs:
+        await update.message.reply_text(
+            "❌ В файле не найдено пар слов.\n\n"
+            "Каждая строка — одна пара, например:\n"
+            "<code>apple - яблоко\ncat\tкот\nbook,книга</code>",
+            parse_mode='HTML'
+        )
+        return
+
+    if skipped:
+        await update.message.reply_text(format_skipped_lines(skipped))
+
+    await submit_words_job(update.message, user_id, pairs, settings, MAX_PAIRS_PER_DOCUMENT)
+
+def read_document_pairs(buffer, skipped):
+    """Пары слов из файла: UTF-8 (с BOM или без), иначе cp1251"""
+    for encoding in ('utf-8-sig', 'cp1251'):
+        buffer.seek(0)
+        del skipped[:]
+        text = io.TextIOWrapper(buffer, encoding=encoding, newline='')
+        pairs = []
+        seen = set()
+        try:
+            # Файл читается блоками целых строк, каждый блок — один проход
+            while True:
+                block = ''.join(text.readlines(DOCUMENT_BLOCK_CHARS))
+                if not block:
+                    return pairs
+                pairs.extend(parse_word_pairs(block, skipped, seen, csv_lines=True))
+        except UnicodeDecodeError:
+            continue
+        finally:
+            text.detach()
+    return []
+
+async def submit_words_job(message, user_id, pairs, settings, max_pairs):
+    """Допуск задачи (лимиты, повторы) и запуск создания аудио"""
+    if len(pairs) > max_pairs:
+        metrics.inc('bot_admission_total', result='too_large')
+        await message.reply_text(
+            f"❌ Слишком много пар слов: {len(pairs)}.\n\n"
+            f"За один раз можно отправить до {max_pairs} пар."
+        )
+        return
+
+    # Повторная отправка того же списка присоединяется к текущей задаче
+    job_key = (user_id, make_track_key(pairs, settings, settings['direction']))
+    if job_key in in_flight_jobs or (
+            SHARDED_WORKERS and await asyncio.to_thread(shared_jobs.has_active, *job_key)):
+        metrics.inc('bot_admission_total', result='coalesced')
+        await message.reply_text(
+            "⏳ Этот список уже обрабатывается — аудио скоро придёт."
+        )
+        return
+
+    retry_after = rate_limiter.admit(user_id, len(pairs))
+    if retry_after:
+        metrics.inc('bot_admission_total', result='rate_limited')
+        await message.reply_text(
+            f"⏳ Слишком много запросов.\n\n"
+            f"Попробуйте снова через {math.ceil(retry_after)} сек."
+        )
+        return
+
+    metrics.inc('bot_admission_total', result='accepted')
+    word_stats.record(pairs, settings['direction'])
+
+    # Задача уходит воркеру своего шарда
+    if SHARDED_WORKERS:
+        await asyncio.to_thread(
+            shared_jobs.enqueue,
+            user_id,
+            message.chat_id,
+            message.message_id,
+            job_key[1],
+            {'pairs': pairs, 'settings': settings.copy()}
+        )
+        return
+
+    job = {
+        'id': secrets.token_hex(8),
+        'user_id': user_id,
+        'chat_id': message.chat_id,
+        'message_id': message.message_id,
+        'pairs': pairs,
+        'settings': settings.copy(),
+    }
+    job_journal.start(job)
+    start_journaled_job(message, job)
+
+def start_journaled_job(message, job):
+    """Запуск задачи из журнала в собственной задаче бота.
+
+    Обработчик обновления не ждёт создания аудио: остановка бота
+    прерывает только такие задачи, а задачи PTB завершаются сами.
+    """
+    job_key = (job['user_id'], make_track_key(job['pairs'], job['settings'], job['settings']['direction']))
+    in_flight_jobs.add(job_key)
+    task = asyncio.create_task(run_journaled_job(message, job, job_key))
+    _running_jobs.add(task)
+    task.add_done_callback(_running_jobs.discard)
+    return task
+
+async def run_journaled_job(message, job, job_key):
+    """Выполнить задачу из журнала; прерванная задача остаётся в журнале.
+
+    Задача, упавшая с ошибкой (например, пользователь заблокировал бота),
+    снимается с журнала, чтобы не повторяться при каждом запуске.
+    """
+    try:
+        try:
+            await send_words_audio(message, job['user_id'], job['pairs'], job['settings'], job)
+        except Exception as e:
+            logger.error(f"Journaled job {job['id']} failed: {e}")
+        job_journal.finish(job['id'])
+    finally:
+        in_flight_jobs.discard(job_key)
+
+def resume_journaled_jobs(bot):
+    """Продолжить задачи, прерванные перезапуском или падением"""
+    jobs = job_journal.load()
+    for job in jobs:
+        start_journaled_job(message_for_job(bot, job), job)
+    if jobs:
+        logger.info(f"Resuming {len(jobs)} journaled jobs")
+
+async def drain_jobs(tasks, deadline=JOB_DRAIN_SEC):
+    """Дождаться текущих задач; не успевшие прерываются и остаются в журнале"""
+    tasks = [task for task in tasks if not task.done()]
+    if not tasks:
+        return
+    logger.info(f"Waiting up to {deadline:g}s for {len(tasks)} running jobs")
+    _, pending = await asyncio.wait(tasks, timeout=deadline)
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+        logger.info(f"{len(pending)} jobs checkpointed for resume")
+
+def format_skipped_lines(skipped, limit=5):
+    """Сообщение о строках, в которых не нашлось пары слов"""
+    text = f"⚠️ Пропущено строк без пары слов: {len(skipped)}\n\n"
+    text += '\n'.join(f"• {line[:100]}" for line in skipped[:limit])
+    if len(skipped) > limit:
+        text += "\n…"
+    return text
+
+def build_words_caption(pairs, first_number=1):
+    """Подпись к аудио со списком слов в пределах лимита Telegram"""
+    header = f"📚 <b><i>Your words. Let's get started!</i></b>\n\n"
+    footer = f"\n🫶🏼 <b><i>You're getting better every day!</i></b>\n"
+    footer += f"<i>Sincerely yours, LinguaBird.</i>"
+
+    words_text = ''
+    for i, pair in enumerate(pairs, first_number):
+        line = f"{i}. <b>{pair['source']}</b> — {pair['target']}\n"
+        if len(header) + len(words_text) + len(line) + len(footer) + 2 > CAPTION_LIMIT:
+            words_text += "…\n"
+            break
+        words_text += line
+
+    return header + words_text + footer
+
+async def reply_track(message, track, output, duration, caption, title, filename=None):
+    """Отправить трек как голосовое сообщение или аудиофайл по профилю.
+
+    Возвращает (отправленное сообщение, file_id трека или None).
+    """
+    if OUTPUT_PROFILES[output]['send'] == 'voice':
+        sent = await message.reply_voice(
+            voice=track,
+            duration=round(duration) if duration else None,
+            filename=filename,
+            caption=caption,
+            parse_mode='HTML'
+        )
+        return sent, sent.voice.file_id if sent.voice is not None else None
+
+    sent = await message.reply_audio(
+        audio=track,
+        duration=round(duration) if duration else None,
+        filename=filename,
+        title=title,
+        performer="English Learning Bot",
+        caption=caption,
+        parse_mode='HTML'
+    )
+    return sent, sent.audio.file_id if sent.audio is not None else None
+
+async def send_cached_track(message, track_key, output, caption, title):
+    """Отправить ранее загруженный трек по file_id; False, если его нет"""
+    cached = file_ids.get(track_key)
+    if cached is None:
+        return False
+
+    file_id, duration = cached
+    try:
+        await reply_track(message, file_id, output, duration, caption, title)
+        metrics.inc('bot_jobs_total', result='file_id')
+        return True
+    except BadRequest as e:
+        logger.warning(f"Cached file_id rejected: {e}")
+        file_ids.delete(track_key)
+        return False
+
+async def send_words_audio(message, user_id, pairs, settings, job=None):
+    """Создание и отправка аудио для списка пар.
+
+    Длинные списки делятся на части по STREAM_CHUNK_PAIRS пар: часть
+    отправляется, как только готова, пока собирается следующая.
+    Для задачи из журнала (job) статус и отправленные части сохраняются,
+    а продолжение после перезапуска пропускает уже отправленные части
+    и обновляет прежнее статусное сообщение.
+    """
+    settings = settings.copy()
     direction = settings['direction']
     dir_info = TRANSLATION_DIRECTIONS[direction]
+    output = get_output_name(settings)
+    extension = OUTPUT_PROFILES[output]['format']
+
+    parts = [
+        pairs[i:i + STREAM_CHUNK_PAIRS]
+        for i in range(0, len(pairs), STREAM_CHUNK_PAIRS)
+    ]
+    total = len(parts)
+    track_keys = [make_track_key(part, settings, direction) for part in parts]
 
-    # Отправка статуса
-    status_msg = await update.message.reply_text(
+    status_text = (
         f"🎙️ Создаю аудио...\n\n"
         f"📊 Пар слов: {len(pairs)}\n"
         f"🌍 {dir_info['name']}\n"
         f"🔁 Повторений: {settings['repeat_count']}×"
     )
-
+    if total > 1:
+        status_text += f"\n📦 Частей: {total}"
+    status_msg = None
+    parts_done = 0
+
+    if job is not None:
+        parts_done = job.get('parts_done', 0)
+        if job.get('status_message_id'):
+            status_msg = make_message(message.get_bot(), message.chat_id, job['status_message_id'])
+            try:
+                await status_msg.edit_text(f"{status_text}\n\n🔄 Продолжаю после перезапуска")
+            except BadRequest as e:
+                logger.warning(f"Resumed status message unavailable: {e}")
+                status_msg = None
+
+    async def report_position(position):
+        await status_msg.edit_text(f"{status_text}\n\n⏳ Вы #{position} в очереди")
+
+    def start_part(index):
+        # Создание аудио в пуле воркеров, не блокируя event loop
+        return asyncio.ensure_future(audio_queue.run(
+            user_id,
+            build_track,
+            parts[index],
+            settings,
+            direction,
+            on_position=report_position
+        ))
+
+    pending = {}
+    first_number = 1
     try:
-        # Создание аудио
-        audio_file = create_audio(pairs, settings, direction)
-
-        # Формирование текста с парами слов (БЕЗ флагов, только Vocabulary)
-        words_text = f"📚 <b><i>Your words. Let's get started!</i></b>\n\n"
-        for i, pair in enumerate(pairs, 1):
-            words_text += f"{i}. <b>{pair['source']}</b> — {pair['target']}\n"
-
-        words_text += f"\n🫶🏼 <b><i>You're getting better every day!</i></b>\n"
-        words_text += f"<i>Sincerely yours, LinguaBird.</i>"
+        for index, part in enumerate(parts):
+            caption = build_words_caption(part, first_number)
+            first_number += len(part)
+            title = dir_info['label']
+            filename = f"english_words_{dir_info['target']}.{extension}"
+            if total > 1:
+                title = f"{title} {index + 1}/{total}"
+                filename = f"english_words_{dir_info['target']}_{index + 1}.{extension}"
+
+            # Часть уже отправлена до перезапуска
+            if index < parts_done:
+                continue
+
+            # Такой же трек уже отправлялся — пересылаем его по file_id
+            if index not in pending and await send_cached_track(
+                    message, track_keys[index], output, caption, title):
+                if job is not None:
+                    job_journal.update(job['id'], parts_done=index + 1)
+                continue
+
+            # Отправка статуса
+            if status_msg is None:
+                status_msg = await message.reply_text(status_text)
+                if job is not None:
+                    job_journal.update(job['id'], status_message_id=status_msg.message_id)
+
+            part_task = pending.pop(index, None) or start_part(index)
+            audio_file, duration = await part_task
+
+            # Следующая часть собирается, пока отправляется текущая
+            if index + 1 < total and file_ids.get(track_keys[index + 1]) is None:
+                pending[index + 1] = start_part(index + 1)
+
+            # Отправка аудио с duration для автоостановки
+            with metrics.timer('bot_stage_seconds', stage='upload'):
+                _, file_id = await reply_track(
+                    message, audio_file, output, duration, caption, title, filename
+                )
+            metrics.inc('bot_jobs_total', result='ok')
+            if file_id is not None:
+                file_ids.put(track_keys[index], file_id, duration)
+            if job is not None:
+                job_journal.update(job['id'], parts_done=index + 1)
+
+            if total > 1 and index + 1 < total:
+                await status_msg.edit_text(
+                    f"{status_text}\n\n✅ Готово частей: {index + 1} из {total}"
+                )
 
         # Удаление статусного сообщения
-        await status_msg.delete()
-
-        # Отправка аудио с duration для автоостановки
-        filename = f"english_words_{dir_info['target']}.mp3"
+        if status_msg is not None:
+            await status_msg.delete()
 
-        await update.message.reply_audio(
-            audio=audio_file,
-            filename=filename,
-            title=dir_info['label'],
-            performer="English Learning Bot",
-            caption=words_text,
-            parse_mode='HTML'
-        )
+    except asyncio.CancelledError:
+        # Остановка бота: задача продолжится после запуска
+        if job is not None and status_msg is not None:
+            try:
+                await status_msg.edit_text(
+                    f"{status_text}\n\n⏸️ Бот перезапускается — продолжу после запуска"
+                )
+            except Exception:
+                pass
+        raise
+
+    except QueueFullError:
+        metrics.inc('bot_jobs_total', result='queue_full')
+        try:
+            await status_msg.edit_text(
+                "⏳ Сейчас слишком много запросов.\n\n"
+                "Попробуйте снова через минуту."
+            )
+        except Exception as reply_error:
+            logger.warning(f"Could not report full queue: {reply_error}")
 
     except Exception as e:
         logger.error(f"Error creating audio: {e}")
-        await status_msg.edit_text(
+        metrics.inc('bot_jobs_total', result='error')
+        error_text = (
             f"❌ Ошибка при создании аудио:\n{str(e)}\n\n"
             f"Попробуйте снова: /start"
         )
+        # Сообщение могло быть удалено, а бот — заблокирован пользователем
+        try:
+            if status_msg is not None:
+                await status_msg.edit_text(error_text)
+            else:
+                await message.reply_text(error_text)
+        except Exception as reply_error:
+            logger.warning(f"Could not report job error: {reply_error}")
+
+    finally:
+        for part_task in pending.values():
+            part_task.cancel()
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /help"""
@@ -363,6 +2764,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 <b>Команды:</b>
 /start - Начать работу
 /settings - Настройки
+/say слово - Произношение одного слова
 /help - Справка
 
 <b>Как использовать:</b>
@@ -374,8 +2776,12 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 cat - кот
 dog - собака</code>
 
+Длинный список можно прислать файлом .txt, .csv или .tsv — по одной паре в строке.
+
 3. Получите MP3 аудио!
 
+Чтобы услышать одно слово, отправьте <code>/say apple</code> или наберите в любом чате <code>@имя_бота apple</code>.
+
 <b>Поддерживаемые направления:</b>
 • English → Русский
 • English → Українська
@@ -403,8 +2809,703 @@ async def example_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 """
     await update.message.reply_text(example_text, parse_mode='HTML')
 
+_CYRILLIC_RE = re.compile('[а-яёіїєґ]', re.IGNORECASE)
+
+def word_lang(text, direction='en-ru'):
+    """Язык слова: кириллица — язык перевода, иначе язык оригинала"""
+    dir_info = TRANSLATION_DIRECTIONS[direction]
+    return dir_info['target'] if _CYRILLIC_RE.search(text) else dir_info['source']
+
+def make_word_key(text, lang, backend):
+    """Ключ голосового клипа одного слова для кэша треков и file_id"""
+    raw = f"voice\0{ClipCache.make_key(text, lang, clip_version(backend))}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def build_word_voice(text, lang, backend):
+    """Голосовое сообщение (Ogg Opus) с одним словом: (байты, длительность)"""
+    key = make_word_key(text, lang, backend)
+    data = track_cache.get(key)
+    if data is None:
+        (_, clip), = fetch_clips([(text, lang)], backend)
+        data = encode_audio(clip, 'voice', clip_format(backend))
+        track_cache.put(key, data)
+    return data, track_duration(data, 'voice')
+
+async def get_word_file_id(bot, text, lang, backend):
+    """file_id голосового клипа слова.
+
+    Новый клип загружается в CLIP_STORAGE_CHAT_ID; без него — None.
+    """
+    key = make_word_key(text, lang, backend)
+    cached = file_ids.get(key)
+    if cached is not None:
+        return cached[0]
+    if not CLIP_STORAGE_CHAT_ID:
+        return None
+
+    data, duration = await asyncio.to_thread(build_word_voice, text, lang, backend)
+    sent = await bot.send_voice(
+        CLIP_STORAGE_CHAT_ID,
+        voice=data,
+        duration=max(1, round(duration)),
+        caption=text
+    )
+    file_ids.put(key, sent.voice.file_id, duration)
+    return sent.voice.file_id
+
+def clean_say_text(text):
+    """Слово или короткая фраза для произношения, None если не подходит"""
+    text = ' '.join(text.split())
+    if not text or len(text) > SAY_MAX_CHARS:
+        return None
+    return text
+
+async def say_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /say — произношение одного слова"""
+    user_id = update.effective_user.id
+    text = clean_say_text(' '.join(context.args))
+    if text is None:
+        await update.message.reply_text(
+            "🔊 Напишите слово после команды, например:\n"
+            "<code>/say apple</code>",
+            parse_mode='HTML'
+        )
+        return
+
+    direction = get_user_settings(user_id)['direction']
+    lang = word_lang(text, direction)
+    backend = get_tts_backend(direction)
+    key = make_word_key(text, lang, backend)
+
+    # Слово уже отправлялось — пересылаем клип по file_id
+    cached = file_ids.get(key)
+    if cached is not None:
+        file_id, duration = cached
+        try:
+            await update.message.reply_voice(voice=file_id, duration=max(1, round(duration or 0)))
+            metrics.inc('bot_say_total', result='file_id')
+            return
+        except BadRequest as e:
+            logger.warning(f"Cached file_id rejected: {e}")
+            file_ids.delete(key)
+
+    retry_after = rate_limiter.admit(user_id, 1)
+    if retry_after:
+        metrics.inc('bot_say_total', result='rate_limited')
+        await update.message.reply_text(
+            f"⏳ Слишком много запросов.\n\n"
+            f"Попробуйте снова через {math.ceil(retry_after)} сек."
+        )
+        return
+
+    try:
+        data, duration = await asyncio.to_thread(build_word_voice, text, lang, backend)
+    except Exception as e:
+        logger.error(f"Error creating word voice: {e}")
+        metrics.inc('bot_say_total', result='error')
+        await update.message.reply_text(f"❌ Не удалось озвучить слово:\n{str(e)}")
+        return
+
+    sent = await update.message.reply_voice(voice=data, duration=max(1, round(duration)))
+    metrics.inc('bot_say_total', result='uploaded')
+    if sent.voice is not None:
+        file_ids.put(key, sent.voice.file_id, duration)
+
+# Последний inline-запрос пользователя, ждущий окончания ввода
+_inline_latest = {}
+
+async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Inline-режим: @bot слово — голосовой клип из кэша"""
+    query = update.inline_query
+    text = clean_say_text(query.query)
+    if text is None:
+        await query.answer([], cache_time=60)
+        return
+
+    user_id = query.from_user.id
+    direction = get_user_settings(user_id)['direction']
+    lang = word_lang(text, direction)
+    backend = get_tts_backend(direction)
+    key = make_word_key(text, lang, backend)
+
+    # Промежуточный ввод ("a", "ap", "app"…) не синтезируется: новый
+    # клип создаётся для запроса, после которого пользователь не печатает
+    cached = file_ids.get(key) is not None
+    synthesize = False
+    if not cached and CLIP_STORAGE_CHAT_ID and len(text) >= INLINE_MIN_CHARS:
+        _inline_latest[user_id] = query.id
+        await asyncio.sleep(INLINE_DEBOUNCE_SEC)
+        if _inline_latest.get(user_id) != query.id:
+            metrics.inc('bot_say_total', result='inline_superseded')
+            return
+        synthesize = not inline_limiter.admit(user_id)
+    _inline_latest.pop(user_id, None)
+
+    file_id = None
+    if cached or synthesize:
+        try:
+            file_id = await get_word_file_id(context.bot, text, lang, backend)
+        except Exception as e:
+            logger.error(f"Error creating inline voice: {e}")
+
+    if file_id is None:
+        metrics.inc('bot_say_total', result='inline_miss')
+        await query.answer([], cache_time=5, is_personal=True)
+        return
+
+    metrics.inc('bot_say_total', result='inline')
+    await query.answer(
+        [InlineQueryResultCachedVoice(id=key[:32], voice_file_id=file_id, title=text)],
+        cache_time=300,
+        is_personal=True
+    )
+
+class JobJournal:
+    """Журнал задач в JSONL, только дозапись.
+
+    По записям start/update/done восстанавливается состояние задачи:
+    чат, сообщение, пары, настройки, статусное сообщение и число
+    отправленных частей. Записи сбрасываются на диск сразу, поэтому
+    журнал переживает перезапуск и падение процесса. При загрузке и при
+    росте сверх compact_bytes журнал сжимается до незавершённых задач.
+    """
+
+    def __init__(self, path=JOB_JOURNAL_PATH, compact_bytes=1024 * 1024):
+        self.path = path
+        self.compact_bytes = compact_bytes
+        self._jobs = {}
+        self._file = None
+        self._compacted_bytes = 0
+
+    def _open(self, mode):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return open(self.path, mode, encoding='utf-8')
+
+    def _append(self, record):
+        if self._file is None:
+            self._file = self._open('a')
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def _rewrite(self):
+        # Сжатый журнал пишется во временный файл и подменяет старый
+        # атомарно, чтобы падение во время сжатия не потеряло задачи
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for job in self._jobs.values():
+                f.write(json.dumps({'event': 'start', **job}, ensure_ascii=False) + '\n')
+        os.replace(temp_path, self.path)
+        self._file = self._open('a')
+        self._compacted_bytes = self._file.tell()
+
+    def load(self):
+        """Незавершённые задачи; журнал переписывается только с ними"""
+        jobs = {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Оборванная при падении последняя запись
+                        continue
+                    event = record.pop('event', None)
+                    job_id = record.get('id')
+                    if event == 'start':
+                        jobs[job_id] = record
+                    elif event == 'update' and job_id in jobs:
+                        jobs[job_id].update(record)
+                    elif event == 'done':
+                        jobs.pop(job_id, None)
+        except FileNotFoundError:
+            pass
+        self._jobs = jobs
+        self._rewrite()
+        return [dict(job) for job in jobs.values()]
+
+    def get(self, job_id):
+        job = self._jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    def start(self, job):
+        """Записать новую задачу"""
+        self._jobs[job['id']] = dict(job)
+        self._append({'event': 'start', **job})
+
+    def update(self, job_id, **fields):
+        """Записать прогресс задачи"""
+        if job_id not in self._jobs:
+            return
+        self._jobs[job_id].update(fields)
+        self._append({'event': 'update', 'id': job_id, **fields})
+
+    def finish(self, job_id):
+        """Задача завершена и больше не продолжится"""
+        if self._jobs.pop(job_id, None) is None:
+            return
+        self._append({'event': 'done', 'id': job_id})
+        # Сжатие и при живых задачах, но не чаще, чем журнал вырастет
+        # вдвое относительно их собственного объёма
+        if self._file.tell() > max(self.compact_bytes, 2 * self._compacted_bytes):
+            self._rewrite()
+
+job_journal = JobJournal(JOB_JOURNAL_PATH)
+
+class SQLiteJobQueue:
+    """Общая очередь задач в SQLite для шардированных воркеров.
+
+    Задача попадает в шард user_id % shards, поэтому задачи одного
+    пользователя всегда выполняет один воркер и по порядку.
+    """
+
+    def __init__(self, path=BOT_DB_PATH, shards=SHARDED_WORKERS):
+        self.path = path
+        self.shards = max(1, shards)
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = open_database(self.path)
+            with self._conn:
+                self._conn.execute(
+                    'CREATE TABLE IF NOT EXISTS jobs ('
+                    'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                    'shard INTEGER NOT NULL, user_id INTEGER NOT NULL, '
+                    'chat_id INTEGER NOT NULL, message_id INTEGER NOT NULL, '
+                    'job_key TEXT NOT NULL, payload TEXT NOT NULL, '
+                    "status TEXT NOT NULL DEFAULT 'pending', "
+                    'created_at REAL NOT NULL, updated_at REAL NOT NULL)'
+                )
+                self._conn.execute(
+                    'CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, shard, id)'
+                )
+                self._conn.execute(
+                    'CREATE TABLE IF NOT EXISTS worker_metrics ('
+                    'shard INTEGER PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)'
+                )
+        return self._conn
+
+    def enqueue(self, user_id, chat_id, message_id, job_key, payload):
+        """Поставить задачу в очередь, возвращает id задачи"""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                'INSERT INTO jobs (shard, user_id, chat_id, message_id, job_key, payload, '
+                'created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (user_id % self.shards, user_id, chat_id, message_id, job_key,
+                 json.dumps(payload, ensure_ascii=False), now, now)
+            )
+            return cursor.lastrowid
+
+    def has_active(self, user_id, job_key):
+        """Есть ли у пользователя невыполненная задача с таким списком"""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT 1 FROM jobs WHERE user_id = ? AND job_key = ? "
+                "AND status IN ('pending', 'running') LIMIT 1",
+                (user_id, job_key)
+            ).fetchone()
+        return row is not None
+
+    def count_active(self):
+        """Количество невыполненных задач во всех шардах"""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'running')"
+            ).fetchone()
+        return row[0]
+
+    def claim(self, shard):
+        """Взять самую старую задачу шарда, пользователь которой не занят"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute(
+                    "SELECT id, user_id, chat_id, message_id, payload FROM jobs "
+                    "WHERE status = 'pending' AND shard = ? AND user_id NOT IN ("
+                    "SELECT user_id FROM jobs WHERE status = 'running' AND shard = ?) "
+                    "ORDER BY id LIMIT 1",
+                    (shard, shard)
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ?",
+                        (time.time(), row[0])
+                    )
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        if row is None:
+            return None
+        return {
+            'id': row[0],
+            'user_id': row[1],
+            'chat_id': row[2],
+            'message_id': row[3],
+            **json.loads(row[4]),
+        }
+
+    def finish(self, job_id, status='done'):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                'UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?',
+                (status, time.time(), job_id)
+            )
+
+    def requeue_running(self, shard):
+        """Вернуть в очередь задачи шарда, прерванные остановкой воркера"""
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'pending', updated_at = ? "
+                "WHERE status = 'running' AND shard = ?",
+                (time.time(), shard)
+            )
+
+    def save_metrics(self, shard, snapshot):
+        """Сохранить метрики воркера для /metrics основного процесса"""
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO worker_metrics (shard, data, updated_at) VALUES (?, ?, ?)',
+                (shard, json.dumps(snapshot), time.time())
+            )
+
+    def load_metrics(self):
+        """Метрики воркеров: [({'shard': номер}, snapshot)]"""
+        with self._lock:
+            rows = self._connect().execute(
+                'SELECT shard, data FROM worker_metrics WHERE shard < ?', (self.shards,)
+            ).fetchall()
+        return [({'shard': shard}, json.loads(data)) for shard, data in rows]
+
+shared_jobs = SQLiteJobQueue(BOT_DB_PATH, SHARDED_WORKERS)
+
+def make_message(bot, chat_id, message_id):
+    """Объект уже отправленного сообщения для ответа или редактирования"""
+    message = Message(
+        message_id=message_id,
+        date=datetime.now(timezone.utc),
+        chat=Chat(id=chat_id, type=Chat.PRIVATE)
+    )
+    message.set_bot(bot)
+    return message
+
+def message_for_job(bot, job):
+    """Сообщение пользователя из задачи, через которое можно отвечать"""
+    return make_message(bot, job['chat_id'], job['message_id'])
+
+async def process_shared_job(bot, job):
+    """Выполнить задачу из общей очереди и отправить результат"""
+    message = message_for_job(bot, job)
+
+    # Прогресс задачи, прерванной перезапуском воркера, берётся из журнала
+    journal_id = f"shared-{job['id']}"
+    state = job_journal.get(journal_id)
+    if state is None:
+        state = {
+            'id': journal_id,
+            'user_id': job['user_id'],
+            'chat_id': job['chat_id'],
+            'message_id': job['message_id'],
+            'pairs': job['pairs'],
+            'settings': job['settings'],
+        }
+        job_journal.start(state)
+
+    # При отмене задача остаётся running и вернётся в очередь при запуске воркера
+    status = 'done'
+    try:
+        await send_words_audio(message, job['user_id'], job['pairs'], job['settings'], state)
+    except Exception as e:
+        logger.error(f"Shared job {job['id']} failed: {e}")
+        status = 'failed'
+    await asyncio.to_thread(shared_jobs.finish, job['id'], status)
+    job_journal.finish(journal_id)
+
+async def run_job_worker(shard):
+    """Воркер шарда: берёт задачи из общей очереди и выполняет их"""
+    global job_journal
+    root, extension = os.path.splitext(JOB_JOURNAL_PATH)
+    job_journal = JobJournal(f"{root}-shard{shard}{extension}")
+    job_journal.load()
+    await asyncio.to_thread(shared_jobs.requeue_running, shard)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    running = set()
+    metrics_saved = 0
+    async with Bot(BOT_TOKEN, **bot_api_urls()) as bot:
+        logger.info(f"Job worker {shard + 1}/{shared_jobs.shards} started")
+        while not stop.is_set():
+            # Метрики воркера попадают в /metrics основного процесса
+            if time.monotonic() - metrics_saved >= WORKER_CHECK_SEC:
+                metrics_saved = time.monotonic()
+                await asyncio.to_thread(shared_jobs.save_metrics, shard, metrics.snapshot())
+
+            job = None
+            if len(running) < AUDIO_WORKERS:
+                job = await asyncio.to_thread(shared_jobs.claim, shard)
+            if job is None:
+                try:
+                    await asyncio.wait_for(stop.wait(), JOB_POLL_SEC)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            task = asyncio.create_task(process_shared_job(bot, job))
+            running.add(task)
+            task.add_done_callback(running.discard)
+
+        await drain_jobs(running)
+    await asyncio.to_thread(shared_jobs.save_metrics, shard, metrics.snapshot())
+    _tts_stopping.set()
+    audio_queue.shutdown()
+
+def job_worker_main(shard):
+    """Точка входа процесса-воркера"""
+    asyncio.run(run_job_worker(shard))
+
+def start_job_worker(shard):
+    """Запуск процесса-воркера шарда"""
+    process = multiprocessing.get_context('spawn').Process(
+        target=job_worker_main,
+        args=(shard,),
+        name=f'job-worker-{shard}'
+    )
+    process.start()
+    return process
+
+def start_job_workers(count):
+    """Запуск процессов-воркеров для всех шардов"""
+    return [start_job_worker(shard) for shard in range(count)]
+
+_job_workers = []
+
+async def supervise_job_workers():
+    """Перезапуск упавших воркеров.
+
+    Новый воркер при старте возвращает в очередь задачи своего шарда,
+    прерванные падением, поэтому они не зависают в pending/running.
+    """
+    while True:
+        await asyncio.sleep(WORKER_CHECK_SEC)
+        for shard, process in enumerate(_job_workers):
+            if process.is_alive():
+                continue
+            logger.error(f"Job worker {shard} exited with code {process.exitcode}, restarting")
+            metrics.inc('bot_worker_restarts_total', shard=shard)
+            process.join()
+            _job_workers[shard] = start_job_worker(shard)
+
+async def is_idle():
+    """Нет ни ожидающих, ни выполняющихся задач генерации аудио"""
+    if audio_queue.depth or audio_queue.running or in_flight_jobs:
+        return False
+    if SHARDED_WORKERS:
+        return not await asyncio.to_thread(shared_jobs.count_active)
+    return True
+
+async def warm_cache_when_idle():
+    """Фоновый прогрев кэша клипов частыми словами.
+
+    Небольшие пачки синтезируются только в простое, поэтому прогрев
+    не задерживает задачи пользователей.
+    """
+    while True:
+        await asyncio.sleep(WARMUP_IDLE_SEC)
+        try:
+            if not await is_idle():
+                continue
+            await asyncio.to_thread(word_stats.flush)
+            words = await asyncio.to_thread(word_stats.top, WARMUP_TOP_WORDS)
+            done, failed = await asyncio.to_thread(
+                warm_clips, expand_warmup_plan(words), WARMUP_CONCURRENCY, WARMUP_BATCH
+            )
+            if done or failed:
+                logger.info(f"Cache warmup: {done} clips synthesized, {failed} failed")
+        except Exception as e:
+            logger.error(f"Cache warmup failed: {e}")
+
+def read_warmup_words(path, direction='en-ru'):
+    """Слова для прогрева из файла: пары слов направления или по слову в строке"""
+    dir_info = TRANSLATION_DIRECTIONS[direction]
+    with open(path, 'rb') as f:
+        buffer = io.BytesIO(f.read())
+    skipped = []
+    words = []
+    for pair in read_document_pairs(buffer, skipped):
+        words.append((pair['source'], dir_info['source']))
+        words.append((pair['target'], dir_info['target']))
+    # Строки без разделителя — отдельные слова языка оригинала
+    words.extend((line, dir_info['source']) for line in skipped)
+    return words
+
+def warmup_main(args):
+    """Прогрев кэша клипов из файла со словами и/или статистики запросов"""
+    words = []
+    if args.words:
+        words.extend(read_warmup_words(args.words, args.direction))
+    if args.top:
+        words.extend(word_stats.top(args.top))
+    plan = expand_warmup_plan(words)
+    print(f"🔥 Прогрев кэша: {len(plan)} клипов, потоков: {args.concurrency}")
+    start = time.perf_counter()
+    done = failed = 0
+    # План синтезируется и готовится пачками, чтобы не держать в памяти
+    # весь список и не терять всю работу из-за одной ошибки
+    batch_size = max(1, WARMUP_BATCH)
+    for offset in range(0, len(plan), batch_size):
+        batch_done, batch_failed = warm_clips(
+            plan[offset:offset + batch_size], args.concurrency, batch_size
+        )
+        done += batch_done
+        failed += batch_failed
+    print(
+        f"✅ Синтезировано: {done}, ошибок: {failed}, уже в кэше: {len(plan) - done - failed} "
+        f"({time.perf_counter() - start:.1f} сек)"
+    )
+
+_background_tasks = []
+
+def bot_api_urls():
+    """Параметры base_url и base_file_url для BOT_API_BASE_URL"""
+    if not BOT_API_BASE_URL:
+        return {}
+    return {
+        'base_url': f"{BOT_API_BASE_URL}/bot",
+        'base_file_url': f"{BOT_API_BASE_URL}/file/bot",
+    }
+
+async def stop_after_drain(application):
+    """Остановка по сигналу: приём обновлений прекращается, текущим
+    задачам даётся JOB_DRAIN_SEC, после чего бот останавливается"""
+    if application.updater is not None and application.updater.running:
+        await application.updater.stop()
+    # Настройки сохраняются сразу: повторный сигнал завершает процесс без них
+    if settings_store is not None:
+        await asyncio.to_thread(settings_store.flush)
+    await asyncio.to_thread(word_stats.flush)
+    await drain_jobs(_running_jobs)
+    application.stop_running()
+
+def exit_now(sig, frame):
+    """Повторный сигнал: немедленное завершение процесса.
+
+    Обычный обработчик signal, а не обработчик цикла событий: он
+    срабатывает, даже если цикл занят остановкой пулов. Незавершённые
+    задачи остаются в журнале и продолжатся после запуска.
+    """
+    logger.warning("Second stop signal, exiting immediately")
+    for process in _job_workers:
+        process.terminate()
+    os._exit(128 + sig)
+
+def install_stop_handlers(application):
+    """Сигналы остановки; повторный сигнал завершает процесс сразу"""
+    loop = asyncio.get_running_loop()
+    stop_signals = (signal.SIGTERM, signal.SIGINT)
+
+    def on_signal():
+        for sig in stop_signals:
+            loop.remove_signal_handler(sig)
+            signal.signal(sig, exit_now)
+        _background_tasks.append(asyncio.create_task(stop_after_drain(application)))
+
+    for sig in stop_signals:
+        loop.add_signal_handler(sig, on_signal)
+
+async def on_startup(application):
+    """Запуск фоновых задач и продолжение задач из журнала"""
+    install_stop_handlers(application)
+    resume_journaled_jobs(application.bot)
+    _background_tasks.append(asyncio.create_task(flush_settings_periodically()))
+    if WARMUP_IDLE_SEC > 0:
+        _background_tasks.append(asyncio.create_task(warm_cache_when_idle()))
+    if _job_workers:
+        _background_tasks.append(asyncio.create_task(supervise_job_workers()))
+    if METRICS_LOG_SEC > 0:
+        _background_tasks.append(asyncio.create_task(log_metrics_periodically()))
+    if METRICS_PORT:
+        start_metrics_server()
+
+async def on_shutdown(application):
+    """Остановка фоновых задач, сохранение настроек и остановка пулов"""
+    # Оставшиеся задачи прерываются и продолжатся после запуска
+    await drain_jobs(_running_jobs, 0)
+    for task in _background_tasks:
+        task.cancel()
+    _background_tasks.clear()
+    if settings_store is not None:
+        settings_store.flush()
+    word_stats.flush()
+    # Сначала останавливается синтез, иначе пул аудио ждёт, пока
+    # прерванные задачи синтезируют все свои клипы. cancel_futures
+    # не подходит: as_completed не узнаёт об отмене и ждёт вечно
+    _tts_stopping.set()
+    if _tts_executor is not None:
+        _tts_executor.shutdown(wait=False)
+    audio_queue.shutdown()
+    for process in _job_workers:
+        process.terminate()
+    for process in _job_workers:
+        process.join(timeout=30)
+
+# Типы обновлений, которые получает каждый вид обработчика
+HANDLER_UPDATE_TYPES = {
+    CommandHandler: Update.MESSAGE,
+    MessageHandler: Update.MESSAGE,
+    CallbackQueryHandler: Update.CALLBACK_QUERY,
+    InlineQueryHandler: Update.INLINE_QUERY,
+}
+
+def get_allowed_updates(application):
+    """Типы обновлений, нужные зарегистрированным обработчикам"""
+    allowed = set()
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            for handler_type, update_type in HANDLER_UPDATE_TYPES.items():
+                if isinstance(handler, handler_type):
+                    allowed.add(update_type)
+    return sorted(allowed)
+
 def main():
     """Запуск бота"""
+    parser = argparse.ArgumentParser(description='English Learning Bot')
+    commands = parser.add_subparsers(dest='command')
+    worker_parser = commands.add_parser('worker', help='воркер шарда общей очереди задач')
+    worker_parser.add_argument('shard', type=int, help='номер шарда, от 0')
+    warmup_parser = commands.add_parser('warmup', help='прогрев кэша клипов')
+    warmup_parser.add_argument('words', nargs='?', help='файл со словами (.txt/.csv/.tsv)')
+    warmup_parser.add_argument('--top', type=int, default=0,
+                               help='добавить N самых частых слов из статистики')
+    warmup_parser.add_argument('--direction', default='en-ru',
+                               choices=list(TRANSLATION_DIRECTIONS),
+                               help='направление пар слов в файле')
+    warmup_parser.add_argument('--concurrency', type=int, default=TTS_CONCURRENCY,
+                               help='параллельных запросов синтеза')
+    args = parser.parse_args()
+
+    if args.command == 'worker':
+        job_worker_main(args.shard)
+        return
+
+    if args.command == 'warmup':
+        if not args.words and not args.top:
+            warmup_parser.error('укажите файл со словами и/или --top N')
+        warmup_main(args)
+        return
+
     print("=" * 60)
     print("🤖 Запуск Telegram бота...")
     print("📚 English Learning Bot")
@@ -417,13 +3518,26 @@ def main():
         return
 
     # Создание приложения
-    application = Application.builder().token(BOT_TOKEN).build()
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(True)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    for option, url in bot_api_urls().items():
+        builder = getattr(builder, option)(url)
+    application = builder.build()
 
     # Регистрация обработчиков
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("example", example_command))
     application.add_handler(CommandHandler("settings", settings_command))
+    application.add_handler(CommandHandler("say", say_command))
+
+    # Произношение слова в inline-режиме
+    application.add_handler(InlineQueryHandler(inline_query))
 
     # Обработчики callback'ов
     application.add_handler(CallbackQueryHandler(direction_callback, pattern='^dir_'))
@@ -432,6 +3546,14 @@ def main():
     # Обработчик текстовых сообщений
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, process_words))
 
+    # Обработчик файлов со словами
+    application.add_handler(MessageHandler(
+        filters.Document.FileExtension('txt')
+        | filters.Document.FileExtension('csv')
+        | filters.Document.FileExtension('tsv'),
+        process_document
+    ))
+
     # Запуск бота
     print("\n✅ Бот успешно запущен!")
     print("📱 Доступные направления:")
@@ -440,7 +3562,34 @@ def main():
     print("\n⏹️  Для остановки нажмите Ctrl+C")
     print("=" * 60 + "\n")
 
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if SHARDED_WORKERS:
+        print(f"🧵 Воркеров-процессов: {SHARDED_WORKERS}")
+        _job_workers.extend(start_job_workers(SHARDED_WORKERS))
+        metrics.add_source(shared_jobs.load_metrics)
+
+    allowed_updates = get_allowed_updates(application)
+
+    if BOT_MODE == 'webhook':
+        if not WEBHOOK_URL:
+            print("\n❌ ОШИБКА: Не задан WEBHOOK_URL для режима webhook!")
+            return
+
+        # Telegram присылает секрет в заголовке каждого запроса,
+        # запросы без него отклоняются
+        secret_token = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=secret_token,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=allowed_updates,
+            stop_signals=None
+        )
+    else:
+        # Сигналы остановки обрабатывает install_stop_handlers
+        application.run_polling(allowed_updates=allowed_updates, stop_signals=None)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
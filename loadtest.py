@@ -0,0 +1,453 @@
+"""
+Нагрузочный тест бота целиком: локальный сервер Bot API и имитация
+пользователей.
+
+bot.py запускается отдельным процессом; BOT_API_BASE_URL указывает на
+встроенный сервер, синтез выполняет заглушка TTS, так что сеть не нужна.
+Каждый пользователь по очереди отправляет списки слов и нажимает кнопки
+настроек, дожидаясь ответа бота. Измеряются задержка от отправки
+обновления до ответа (перцентили), задержка до начала обработки
+(от выдачи обновления боту до его первого запроса к API) и пропускная
+способность.
+
+Примеры:
+    python loadtest.py
+    python loadtest.py --users 2000 --actions 5 --output load.json
+    python loadtest.py --words-ratio 0.5 --env AUDIO_WORKERS=4 SHARDED_WORKERS=2
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import signal
+import asyncio
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from collections import Counter
+from email.parser import BytesParser
+from email.policy import default as email_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+BOT_TOKEN = '123456:LOADTEST'
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'Load Test Bot', 'username': 'loadtest_bot'}
+SETTINGS_TAPS = ['change_pause', 'pause_800', 'change_repeat', 'repeat_3', 'dir_en-ru', 'dir_en-uk']
+LONG_POLL_SEC = 1.0
+STOP_TIMEOUT_SEC = 60
+
+def parse_params(content_type, body):
+    """Параметры запроса Bot API: form-urlencoded, multipart или JSON"""
+    if content_type.startswith('multipart/form-data'):
+        message = BytesParser(policy=email_policy).parsebytes(
+            b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n\r\n' + body
+        )
+        params = {}
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            if part.get_filename():
+                params[name] = part.get_payload(decode=True)
+            else:
+                params[name] = part.get_content()
+        return params
+    if 'json' in content_type:
+        return json.loads(body or b'{}')
+    return {key: values[0] for key, values in parse_qs(body.decode('utf-8')).items()}
+
+class FakeBotAPI:
+    """Минимальный Bot API: очередь обновлений для getUpdates и ответы на
+    методы отправки, которые вызывает bot.py"""
+
+    def __init__(self, on_request, on_deliver):
+        self.on_request = on_request
+        self.on_deliver = on_deliver
+        self.requests = Counter()
+        self.upload_bytes = 0
+        self.ready = threading.Event()
+        self._updates = []
+        self._next_update_id = 1
+        self._next_message_id = 1000
+        self._delivered = set()
+        self._cond = threading.Condition()
+
+    def push_update(self, update):
+        """Добавить обновление, возвращает его update_id"""
+        with self._cond:
+            update['update_id'] = self._next_update_id
+            self._next_update_id += 1
+            self._updates.append(update)
+            self._cond.notify_all()
+        return update['update_id']
+
+    def _get_updates(self, offset, timeout):
+        with self._cond:
+            # offset подтверждает все обновления до него
+            self._updates = [u for u in self._updates if u['update_id'] >= offset]
+            self._cond.wait_for(lambda: self._updates, timeout=min(timeout, LONG_POLL_SEC))
+            updates = self._updates[:100]
+            fresh = [u for u in updates if u['update_id'] not in self._delivered]
+            self._delivered.update(u['update_id'] for u in fresh)
+        for update in fresh:
+            self.on_deliver(update['update_id'])
+        return updates
+
+    def _message(self, chat_id, params):
+        with self._cond:
+            self._next_message_id += 1
+            message_id = self._next_message_id
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+            'text': params.get('text', ''),
+        }
+
+    def call(self, method, params, size):
+        """Выполнить метод, возвращает поле result ответа"""
+        method = method.lower()
+        self.requests[method] += 1
+        self.upload_bytes += size
+        chat_id = int(params['chat_id']) if 'chat_id' in params else None
+
+        if method == 'getme':
+            result = BOT_USER
+        elif method == 'getupdates':
+            self.ready.set()
+            return self._get_updates(int(params.get('offset', 0)), float(params.get('timeout', 0)))
+        elif method in ('sendmessage', 'sendaudio', 'sendvoice', 'senddocument'):
+            result = self._message(chat_id, params)
+            kind = method[4:]
+            if kind != 'message':
+                file_id = f"{kind}-{result['message_id']}"
+                result[kind] = {
+                    'file_id': file_id,
+                    'file_unique_id': file_id,
+                    'duration': int(float(params.get('duration') or 0)),
+                }
+        elif method == 'editmessagetext':
+            result = self._message(chat_id, params)
+            result['message_id'] = int(params['message_id'])
+        else:
+            result = True
+
+        self.on_request(method, chat_id, params)
+        return result
+
+class FakeBotAPIHandler(BaseHTTPRequestHandler):
+    """HTTP-обёртка FakeBotAPI: /bot<токен>/<метод>"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        method = self.path.rstrip('/').rsplit('/', 1)[-1].split('?', 1)[0]
+        params = parse_params(self.headers.get('Content-Type', ''), body)
+        try:
+            payload = {'ok': True, 'result': self.server.api.call(method, params, length)}
+        except Exception as e:
+            payload = {'ok': False, 'error_code': 400, 'description': f"Bad Request: {e}"}
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # Бот закрыл long polling при остановке
+            pass
+
+    do_GET = _handle
+    do_POST = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+def start_fake_api(api, host='127.0.0.1', port=0):
+    """Запуск сервера в фоновом потоке, возвращает сервер"""
+    server = ThreadingHTTPServer((host, port), FakeBotAPIHandler)
+    server.daemon_threads = True
+    server.api = api
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+class LoadGenerator:
+    """Пользователи с одним незавершённым действием у каждого"""
+
+    def __init__(self, args, loop):
+        self.args = args
+        self.loop = loop
+        self.api = FakeBotAPI(self._on_request_threadsafe, self._on_deliver_threadsafe)
+        self.results = []
+        self._pending = {}
+        self._by_update = {}
+        self._by_callback = {}
+        self._callback_id = 0
+
+    def _on_request_threadsafe(self, method, chat_id, params):
+        self.loop.call_soon_threadsafe(self._on_request, method, chat_id, params, time.perf_counter())
+
+    def _on_deliver_threadsafe(self, update_id):
+        self.loop.call_soon_threadsafe(self._on_deliver, update_id, time.perf_counter())
+
+    def _on_deliver(self, update_id, now):
+        action = self._by_update.get(update_id)
+        if action is not None and action['delivered'] is None:
+            action['delivered'] = now
+
+    def _on_request(self, method, chat_id, params, now):
+        if chat_id is None:
+            chat_id = self._by_callback.get(params.get('callback_query_id'))
+        action = self._pending.get(chat_id)
+        if action is None:
+            return
+        if action['first_response'] is None:
+            action['first_response'] = now
+
+        text = params.get('text', '')
+        if action['kind'] == 'words':
+            if method in ('sendaudio', 'sendvoice'):
+                self._finish(chat_id, 'ok', now)
+            elif method in ('sendmessage', 'editmessagetext') and text.startswith('⏳'):
+                self._finish(chat_id, 'rejected', now)
+            elif method in ('sendmessage', 'editmessagetext') and text.startswith('❌'):
+                self._finish(chat_id, 'error', now)
+        elif method == 'editmessagetext':
+            self._finish(chat_id, 'ok', now)
+
+    def _finish(self, chat_id, status, now):
+        action = self._pending.pop(chat_id)
+        action['status'] = status
+        action['done'] = now
+        if not action['future'].done():
+            action['future'].set_result(None)
+
+    def _user(self, user_id):
+        return {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'}
+
+    def _word_update(self, user_id, rng):
+        size = rng.randint(self.args.min_pairs, self.args.max_pairs)
+        words = rng.sample(range(self.args.vocab), size)
+        text = '\n'.join(f"word{word} - слово{word}" for word in words)
+        return {'message': {
+            'message_id': rng.randint(1, 10 ** 9),
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': self._user(user_id),
+            'text': text,
+        }}
+
+    def _tap_update(self, user_id, rng):
+        self._callback_id += 1
+        callback_id = str(self._callback_id)
+        self._by_callback[callback_id] = user_id
+        return {'callback_query': {
+            'id': callback_id,
+            'from': self._user(user_id),
+            'chat_instance': str(user_id),
+            'data': rng.choice(SETTINGS_TAPS),
+            'message': {
+                'message_id': 1,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': BOT_USER,
+                'text': 'Настройки',
+            },
+        }}
+
+    async def run_user(self, user_id):
+        rng = random.Random(user_id)
+        # Пользователи подключаются равномерно в течение ramp-sec
+        await asyncio.sleep(rng.uniform(0, self.args.ramp_sec))
+        for _ in range(self.args.actions):
+            kind = 'words' if rng.random() < self.args.words_ratio else 'settings'
+            update = self._word_update(user_id, rng) if kind == 'words' else self._tap_update(user_id, rng)
+            action = {
+                'kind': kind,
+                'sent': time.perf_counter(),
+                'delivered': None,
+                'first_response': None,
+                'done': None,
+                'status': None,
+                'future': self.loop.create_future(),
+            }
+            self._pending[user_id] = action
+            self._by_update[self.api.push_update(update)] = action
+            try:
+                await asyncio.wait_for(asyncio.shield(action['future']), self.args.timeout)
+            except asyncio.TimeoutError:
+                self._pending.pop(user_id, None)
+                action['status'] = 'timeout'
+            self.results.append(action)
+            await asyncio.sleep(rng.expovariate(1 / self.args.think_sec) if self.args.think_sec else 0)
+
+def start_bot(args, api_url, work_dir):
+    """Запуск bot.py против локального сервера"""
+    env = dict(os.environ)
+    env.update({
+        'BOT_TOKEN': BOT_TOKEN,
+        'BOT_API_BASE_URL': api_url,
+        'BOT_MODE': 'polling',
+        'TTS_BACKEND': 'stub',
+        'CLIP_CACHE_DIR': os.path.join(work_dir, 'clips'),
+        'TRACK_CACHE_DIR': os.path.join(work_dir, 'tracks'),
+        'BOT_DB_PATH': os.path.join(work_dir, 'bot.sqlite3'),
+        'JOB_JOURNAL_PATH': os.path.join(work_dir, 'jobs.jsonl'),
+        'WARMUP_IDLE_SEC': '0',
+        'METRICS_LOG_SEC': '0',
+        # Лимиты допуска не должны скрывать пропускную способность
+        'USER_JOBS_PER_MIN': '1000000',
+        'USER_PAIRS_PER_MIN': '1000000000',
+        'GLOBAL_JOBS_PER_MIN': '1000000',
+        'GLOBAL_PAIRS_PER_MIN': '1000000000',
+        'AUDIO_QUEUE_SIZE': str(args.users),
+    })
+    for item in args.env:
+        name, _, value = item.partition('=')
+        env[name] = value
+    log = open(os.path.join(work_dir, 'bot.log'), 'wb')
+    bot_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bot.py')
+    process = subprocess.Popen(
+        [sys.executable, bot_path],
+        env=env,
+        cwd=work_dir,
+        stdout=log,
+        stderr=subprocess.STDOUT
+    )
+    return process, log
+
+def stop_bot(process):
+    """Остановка бота тем же сигналом, что и при деплое"""
+    if process.poll() is not None:
+        return
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(STOP_TIMEOUT_SEC)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+def summarize(results, elapsed):
+    """Сводка по видам действий"""
+    report = {}
+    for kind in ('words', 'settings'):
+        actions = [a for a in results if a['kind'] == kind]
+        if not actions:
+            continue
+        completed = [a for a in actions if a['done'] is not None]
+        latency = [a['done'] - a['sent'] for a in completed]
+        queueing = [
+            a['first_response'] - a['delivered']
+            for a in actions
+            if a['first_response'] is not None and a['delivered'] is not None
+        ]
+        ok = sum(1 for a in actions if a['status'] == 'ok')
+        report[kind] = {
+            'count': len(actions),
+            'status': dict(Counter(a['status'] for a in actions)),
+            'throughput': ok / elapsed if elapsed else 0,
+            'latency': {f"p{int(q * 100)}": percentile(latency, q) for q in (0.5, 0.9, 0.99)},
+            'latency_max': max(latency) if latency else None,
+            'queueing': {f"p{int(q * 100)}": percentile(queueing, q) for q in (0.5, 0.9, 0.99)},
+        }
+    return report
+
+def format_seconds(value):
+    return '-' if value is None else f"{value * 1000:.0f}ms"
+
+def print_report(report, elapsed, api):
+    print(f"\nДлительность: {elapsed:.1f} сек")
+    for kind, stats in report.items():
+        statuses = ' '.join(f"{name}={count}" for name, count in sorted(stats['status'].items()))
+        latency = ' '.join(f"{name}={format_seconds(value)}" for name, value in stats['latency'].items())
+        queueing = ' '.join(f"{name}={format_seconds(value)}" for name, value in stats['queueing'].items())
+        print(
+            f"{kind:<8} n={stats['count']:<6} {statuses} | {stats['throughput']:.1f}/сек | "
+            f"задержка {latency} max={format_seconds(stats['latency_max'])} | "
+            f"до обработки {queueing}"
+        )
+    requests = ' '.join(f"{name}={count}" for name, count in api.requests.most_common())
+    print(f"Bot API: {requests} | загружено {api.upload_bytes / 1024 / 1024:.1f} MB")
+
+async def run(args, work_dir):
+    loop = asyncio.get_running_loop()
+    generator = LoadGenerator(args, loop)
+    server = start_fake_api(generator.api)
+    api_url = f"http://{server.server_address[0]}:{server.server_address[1]}"
+    process, log = start_bot(args, api_url, work_dir)
+    try:
+        ready = await asyncio.to_thread(generator.api.ready.wait, args.timeout)
+        if not ready or process.poll() is not None:
+            print(f"Бот не запустился, см. {log.name}")
+            return None
+
+        print(f"Пользователей: {args.users}, действий на пользователя: {args.actions}")
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            generator.run_user(user_id) for user_id in range(1, args.users + 1)
+        ))
+        elapsed = time.perf_counter() - start
+    finally:
+        await asyncio.to_thread(stop_bot, process)
+        log.close()
+        server.shutdown()
+
+    report = summarize(generator.results, elapsed)
+    print_report(report, elapsed, generator.api)
+    return {
+        'elapsed': elapsed,
+        'kinds': report,
+        'api_requests': dict(generator.api.requests),
+        'upload_bytes': generator.api.upload_bytes,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест бота с локальным Bot API')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--actions', type=int, default=3, help='действий на пользователя')
+    parser.add_argument('--words-ratio', type=float, default=0.3,
+                        help='доля списков слов среди действий, остальное — кнопки настроек')
+    parser.add_argument('--min-pairs', type=int, default=3)
+    parser.add_argument('--max-pairs', type=int, default=20)
+    parser.add_argument('--vocab', type=int, default=2000, help='размер словаря списков')
+    parser.add_argument('--think-sec', type=float, default=1.0,
+                        help='средняя пауза пользователя между действиями')
+    parser.add_argument('--ramp-sec', type=float, default=10.0)
+    parser.add_argument('--timeout', type=float, default=120.0, help='ожидание ответа бота')
+    parser.add_argument('--env', nargs='*', default=[], metavar='NAME=VALUE',
+                        help='переменные окружения бота')
+    parser.add_argument('--output', help='сохранить результаты в JSON')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='loadtest-') as work_dir:
+        result = asyncio.run(run(args, work_dir))
+        if result is None:
+            with open(os.path.join(work_dir, 'bot.log'), 'rb') as f:
+                sys.stdout.write(f.read()[-4000:].decode('utf-8', 'replace'))
+            return 1
+
+    if args.output:
+        result.update({
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'args': vars(args),
+        })
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"\nРезультаты сохранены в {args.output}")
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.error import Forbidden
+
+import bot
+from bot import JobJournal
+
+
+def make_job(job_id, pairs=10):
+    return {
+        'id': job_id,
+        'user_id': 1,
+        'chat_id': 1,
+        'message_id': 1,
+        'pairs': [{'source': f'word{i}', 'target': f'слово{i}'} for i in range(pairs)],
+        'settings': dict(bot.DEFAULT_SETTINGS),
+    }
+
+
+def test_load_restores_unfinished_jobs(tmp_path):
+    path = str(tmp_path / 'jobs.jsonl')
+    journal = JobJournal(path)
+    journal.load()
+    journal.start(make_job('a'))
+    journal.start(make_job('b'))
+    journal.update('a', parts_done=2)
+    journal.finish('b')
+
+    jobs = JobJournal(path).load()
+    assert [(job['id'], job.get('parts_done')) for job in jobs] == [('a', 2)]
+
+
+def test_compacts_while_jobs_are_live(tmp_path):
+    path = str(tmp_path / 'jobs.jsonl')
+    journal = JobJournal(path, compact_bytes=4096)
+    journal.load()
+    journal.start(make_job('live'))
+    for index in range(200):
+        journal.start(make_job(index))
+        journal.finish(index)
+        assert os.path.getsize(path) <= 2 * 4096
+
+    jobs = JobJournal(path).load()
+    assert [job['id'] for job in jobs] == ['live']
+
+
+class FailingMessage:
+    chat_id = 1
+
+    async def reply_text(self, *args, **kwargs):
+        raise Forbidden('Forbidden: bot was blocked by the user')
+
+    def get_bot(self):
+        return None
+
+
+def test_failed_job_leaves_journal(tmp_path, monkeypatch):
+    journal = JobJournal(str(tmp_path / 'jobs.jsonl'))
+    journal.load()
+    monkeypatch.setattr(bot, 'job_journal', journal)
+
+    async def send_cached_track(*args, **kwargs):
+        return False
+
+    monkeypatch.setattr(bot, 'send_cached_track', send_cached_track)
+    job = make_job('x', pairs=2)
+    journal.start(job)
+    bot.in_flight_jobs.add('key')
+
+    asyncio.run(bot.run_journaled_job(FailingMessage(), job, 'key'))
+
+    assert journal.load() == []
+    assert 'key' not in bot.in_flight_jobs
@@ -0,0 +1,123 @@
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from bot import parse_word_pairs, read_document_pairs
+
+
+def pairs(text, **kwargs):
+    return [(pair['source'], pair['target']) for pair in parse_word_pairs(text, **kwargs)]
+
+
+@pytest.mark.parametrize('line, expected', [
+    ('apple - яблоко', ('apple', 'яблоко')),
+    ('apple — яблоко', ('apple', 'яблоко')),
+    ('apple—яблоко', ('apple', 'яблоко')),
+    ('apple – яблоко', ('apple', 'яблоко')),
+    ('apple: яблоко', ('apple', 'яблоко')),
+    ('apple : яблоко', ('apple', 'яблоко')),
+    ('apple = яблоко', ('apple', 'яблоко')),
+    ('apple=яблоко', ('apple', 'яблоко')),
+    ('apple | яблоко', ('apple', 'яблоко')),
+    ('apple\tяблоко', ('apple', 'яблоко')),
+    ('well-known - известный', ('well-known', 'известный')),
+    ('  apple   -   яблоко  ', ('apple', 'яблоко')),
+    ('"ice cream" - мороженое', ('ice cream', 'мороженое')),
+])
+def test_separators(line, expected):
+    assert pairs(line) == [expected]
+
+
+@pytest.mark.parametrize('line, expected', [
+    ('e=mc2 - формула', ('e=mc2', 'формула')),
+    ('re: subject - тема', ('re: subject', 'тема')),
+    ('a | b - в', ('a | b', 'в')),
+    ('apple - яблоко - фрукт', ('apple', 'яблоко - фрукт')),
+    ('time: 12:30 - время', ('time: 12:30', 'время')),
+])
+def test_spaced_dash_takes_precedence(line, expected):
+    assert pairs(line) == [expected]
+
+
+def test_numbered_list():
+    text = '1. apple - яблоко\n2) cat - кот\n10. dog - собака'
+    assert pairs(text) == [('apple', 'яблоко'), ('cat', 'кот'), ('dog', 'собака')]
+
+
+def test_numbered_table_paste():
+    assert pairs('1.\tapple\tяблоко\n2)\tcat\tкот') == [('apple', 'яблоко'), ('cat', 'кот')]
+
+
+@pytest.mark.parametrize('line', ['apple\t-\tяблоко', 'apple\xa0-\xa0яблоко', 'apple -\tяблоко'])
+def test_dash_between_other_spaces(line):
+    assert pairs(line) == [('apple', 'яблоко')]
+
+
+def test_table_paste_drops_extra_columns():
+    text = 'apple\tяблоко\tfruit\ncat\t\tкот\r\n'
+    assert pairs(text) == [('apple', 'яблоко'), ('cat', 'кот')]
+
+
+def test_duplicates_removed():
+    assert pairs('apple - яблоко\napple - яблоко\nApple - яблоко') == [
+        ('apple', 'яблоко'),
+        ('Apple', 'яблоко'),
+    ]
+
+
+def test_skipped_lines_reported():
+    skipped = []
+    text = 'apple - яблоко\njust text\n\n12:30\napple - \n- яблоко'
+    assert pairs(text, skipped=skipped) == [('apple', 'яблоко')]
+    assert skipped == ['just text', '12:30', 'apple -', '- яблоко']
+
+
+def test_csv_only_for_csv_like_lines_in_messages():
+    skipped = []
+    text = 'book,книга\nbook;книга\n"ice, cream",мороженое\nHello, world'
+    assert pairs(text, skipped=skipped) == [
+        ('book', 'книга'),
+        ('ice, cream', 'мороженое'),
+    ]
+    assert skipped == ['Hello, world']
+
+
+def test_csv_lines_in_documents():
+    assert pairs('apple, яблоко', csv_lines=True) == [('apple', 'яблоко')]
+
+
+def test_seen_shared_between_parts():
+    seen = set()
+    assert pairs('apple - яблоко', seen=seen) == [('apple', 'яблоко')]
+    assert pairs('apple - яблоко\ncat - кот', seen=seen) == [('cat', 'кот')]
+
+
+def test_empty_text():
+    assert pairs('') == []
+    assert pairs('\n  \n') == []
+
+
+@pytest.mark.parametrize('encoding', ['utf-8', 'utf-8-sig', 'cp1251'])
+def test_document_encodings(encoding):
+    data = 'apple,яблоко\r\nHello, world\r\ncat\tкот\r\nпросто текст\r\n'.encode(encoding)
+    skipped = []
+    result = read_document_pairs(io.BytesIO(data), skipped)
+    assert [(pair['source'], pair['target']) for pair in result] == [
+        ('apple', 'яблоко'),
+        ('Hello', 'world'),
+        ('cat', 'кот'),
+    ]
+    assert skipped == ['просто текст']
+
+
+def test_document_read_in_blocks(monkeypatch):
+    import bot
+    monkeypatch.setattr(bot, 'DOCUMENT_BLOCK_CHARS', 32)
+    lines = [f'word{i} - слово{i}' for i in range(100)] * 2
+    data = '\n'.join(lines).encode('utf-8')
+    result = read_document_pairs(io.BytesIO(data), [])
+    assert [pair['source'] for pair in result] == [f'word{i}' for i in range(100)]
@@ -0,0 +1,13 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot import build_synthesis_plan, parse_word_pairs
+
+
+def test_plan_dedups_on_cache_key():
+    pairs = parse_word_pairs("Apple - яблоко\napple - яблоко\npear - Груша\ncat -  груша")
+    assert build_synthesis_plan(pairs) == [
+        ('Apple', 'en'), ('яблоко', 'ru'), ('pear', 'en'), ('Груша', 'ru'), ('cat', 'en'),
+    ]